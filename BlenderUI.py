@@ -1,3 +1,5 @@
+import time
+import traceback
 import bpy
 
 
@@ -6,3 +8,82 @@ def MessageBox(message="", title="Glacier Engine", icon="INFO"):
         self.layout.label(text=message)
 
     bpy.context.window_manager.popup_menu(draw, title=title, icon=icon)
+
+
+class BatchOperator:
+    """
+    Mixin for operators that process a list of items, like files or collections.
+    The work is given as a generator that yields once per finished item and returns the operator result.
+    The generator is run from a modal timer in time slices, so Blender stays responsive,
+    reports its progress in the status bar and can be cancelled with Esc.
+    Without a window the generator simply runs to completion
+    """
+
+    batch_time_slice = 0.1
+
+    def run_batch(self, context, steps, total: int, label: str = "Processing"):
+        self._batch_steps = steps
+        self._batch_total = max(total, 1)
+        self._batch_done = 0
+        self._batch_label = label
+        self._batch_start = time.perf_counter()
+
+        if bpy.app.background or context.window is None:
+            while True:
+                try:
+                    next(steps)
+                except StopIteration as result:
+                    return result.value or {"FINISHED"}
+
+        wm = context.window_manager
+        wm.progress_begin(0, self._batch_total)
+        self._batch_timer = wm.event_timer_add(0.0, window=context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self._batch_steps.close()
+            self.report(
+                {"WARNING"},
+                "%s cancelled after %d of %d"
+                % (self._batch_label, self._batch_done, self._batch_total),
+            )
+            return self.end_batch(context, {"CANCELLED"})
+
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        deadline = time.perf_counter() + self.batch_time_slice
+        while time.perf_counter() < deadline:
+            try:
+                next(self._batch_steps)
+            except StopIteration as result:
+                return self.end_batch(context, result.value or {"FINISHED"})
+            except Exception as err:
+                # the generator is finished once it raised, end the batch instead of reporting it as finished
+                traceback.print_exc()
+                self.report(
+                    {"ERROR"},
+                    "%s failed after %d of %d: %s"
+                    % (self._batch_label, self._batch_done, self._batch_total, err),
+                )
+                return self.end_batch(context, {"CANCELLED"})
+            self._batch_done += 1
+
+        elapsed = time.perf_counter() - self._batch_start
+        rate = self._batch_done / elapsed if elapsed > 0 else 0
+        eta = (self._batch_total - self._batch_done) / rate if rate > 0 else 0
+        context.window_manager.progress_update(self._batch_done)
+        context.workspace.status_text_set(
+            "%s %d/%d - %.1f/s - ETA %ds (Esc to cancel)"
+            % (self._batch_label, self._batch_done, self._batch_total, rate, eta)
+        )
+        return {"RUNNING_MODAL"}
+
+    def end_batch(self, context, result):
+        wm = context.window_manager
+        wm.event_timer_remove(self._batch_timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        return result
@@ -15,8 +15,11 @@ from . import file_mjba
 from . import file_borg
 
 
+from bpy.app.handlers import persistent
+
 from bpy.props import (
     BoolVectorProperty,
+    IntProperty,
     PointerProperty,
 )
 
@@ -29,17 +32,119 @@ from bpy.types import (
 # ------------------------------------------------------------------------
 
 
+# scene -> mask -> names of the mesh objects that use it, per visibility toggle.
+# The index also remembers the mesh of every object and the masks of every mesh, an update only drops it
+# when it changes one of those, moving or editing objects keeps it
+visibility_indexes = {}
+
+# scene -> visibility toggle -> names of the objects whose visibility follows the shown mask of that toggle.
+# Objects that are not in it yet, like freshly imported ones, get the full mask applied instead of the difference
+visibility_synced = {}
+
+
+def get_visibility_masks(mesh):
+    """Returns the LOD mask and the collision type mask of a mesh"""
+    lod = mesh.prim_properties.lod
+    collision_type = mesh.aloc_properties.collision_type
+    return (
+        sum(1 << bit for bit in range(8) if lod[bit]),
+        sum(1 << bit for bit in range(6) if collision_type[bit]),
+    )
+
+
+def changes_visibility_index(visibility_index, depsgraph):
+    """Returns True when the depsgraph updates rename an object, swap its mesh or change the masks of a mesh"""
+    for update in depsgraph.updates:
+        updated = update.id.original
+        if isinstance(updated, bpy.types.Object):
+            if updated.type != "MESH":
+                continue
+            if visibility_index["objects"].get(updated.name) != updated.data.name:
+                return True
+        elif isinstance(updated, bpy.types.Mesh):
+            if visibility_index["meshes"].get(updated.name) != get_visibility_masks(
+                updated
+            ):
+                return True
+    return False
+
+
+@persistent
+def invalidate_visibility_index(scene, depsgraph=None):
+    if depsgraph is None:
+        visibility_indexes.clear()
+        visibility_synced.clear()
+        return
+
+    visibility_index = visibility_indexes.get(scene.as_pointer())
+    if visibility_index is not None and changes_visibility_index(
+        visibility_index, depsgraph
+    ):
+        visibility_indexes.pop(scene.as_pointer())
+
+
+def get_visibility_index(scene):
+    scene_key = scene.as_pointer()
+    visibility_index = visibility_indexes.get(scene_key)
+    if visibility_index is not None and visibility_index["num_objects"] != len(
+        scene.objects
+    ):
+        visibility_index = None
+
+    if visibility_index is None:
+        lod_index = {}
+        collision_type_index = {}
+        objects = {}
+        meshes = {}
+        for obj in scene.objects:
+            if obj.type != "MESH":
+                continue
+            masks = meshes.get(obj.data.name)
+            if masks is None:
+                masks = meshes[obj.data.name] = get_visibility_masks(obj.data)
+            objects[obj.name] = obj.data.name
+            lod_mask, collision_type_mask = masks
+            lod_index.setdefault(lod_mask, []).append(obj.name)
+            collision_type_index.setdefault(collision_type_mask, []).append(obj.name)
+
+        visibility_index = {
+            "num_objects": len(scene.objects),
+            "objects": objects,
+            "meshes": meshes,
+            "lod": lod_index,
+            "collision_type": collision_type_index,
+        }
+        visibility_indexes[scene_key] = visibility_index
+    return visibility_index
+
+
+def update_visibility(scene, index_key: str, show_mask: int, last_mask: int):
+    """
+    Shows the mesh objects that have a bit of show_mask set and hides the others.
+    Objects that already followed last_mask are only touched when their visibility differs between the two masks
+    """
+    index = get_visibility_index(scene)[index_key]
+    synced = visibility_synced.setdefault(scene.as_pointer(), {}).get(index_key, set())
+    indexed = set()
+    for mask, names in index.items():
+        was_shown = mask & last_mask != 0
+        should_show = mask & show_mask != 0
+        indexed.update(names)
+
+        for name in names:
+            if was_shown == should_show and name in synced:
+                continue
+            obj = scene.objects.get(name)
+            if obj is not None:
+                obj.hide_set(not should_show)
+    visibility_synced[scene.as_pointer()][index_key] = indexed
+
+
 class GlacierSettings(PropertyGroup):
     def show_lod_update(self, context):
-        mesh_obs = [o for o in bpy.context.scene.objects if o.type == "MESH"]
-        for obj in mesh_obs:
-            should_show = False
-            for bit in range(8):
-                if self.show_lod[bit]:
-                    if obj.data.prim_properties.lod[bit] == self.show_lod[bit]:
-                        should_show = True
-
-            obj.hide_set(not should_show)
+        show_mask = sum(1 << bit for bit in range(8) if self.show_lod[bit])
+        update_visibility(self.id_data, "lod", show_mask, self.shown_lod_mask)
+        self.shown_lod_mask = show_mask
 
         return None
 
@@ -52,16 +157,17 @@ class GlacierSettings(PropertyGroup):
         update=show_lod_update,
     )
 
-    def show_collision_type_update(self, context):
-        mesh_obs = [o for o in bpy.context.scene.objects if o.type == "MESH"]
-        for obj in mesh_obs:
-            should_show = False
-            for bit in range(6):
-                if self.show_collision_type[bit]:
-                    if obj.data.aloc_properties.collision_type[bit] == self.show_collision_type[bit]:
-                        should_show = True
+    shown_lod_mask: IntProperty(default=0xFF, options={"HIDDEN"})
 
-            obj.hide_set(not should_show)
+    def show_collision_type_update(self, context):
+        show_mask = sum(1 << bit for bit in range(6) if self.show_collision_type[bit])
+        update_visibility(
+            self.id_data,
+            "collision_type",
+            show_mask,
+            self.shown_collision_type_mask,
+        )
+        self.shown_collision_type_mask = show_mask
 
         return None
 
@@ -74,6 +180,8 @@ class GlacierSettings(PropertyGroup):
         update=show_collision_type_update,
     )
 
+    shown_collision_type_mask: IntProperty(default=0b111111, options={"HIDDEN"})
+
 
 # ------------------------------------------------------------------------
 #    Panels
@@ -105,6 +213,8 @@ class GLACIER_PT_settingsPanel(bpy.types.Panel):
         ):
             row.prop(glacier_settings, "show_collision_type", index=i, text=name, toggle=True)
 
+        layout.operator("prim.load_placeholder_geometry")
+
 
 # ------------------------------------------------------------------------
 #    Registration
@@ -130,6 +240,8 @@ def register():
         register_class(cls)
 
     bpy.types.Scene.glacier_settings = PointerProperty(type=GlacierSettings)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_visibility_index)
+    bpy.app.handlers.load_post.append(invalidate_visibility_index)
 
 
 def unregister():
@@ -141,6 +253,9 @@ def unregister():
     for cls in classes:
         unregister_class(cls)
 
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_visibility_index)
+    bpy.app.handlers.load_post.remove(invalidate_visibility_index)
+
     del bpy.types.Scene.glacier_settings
 
 
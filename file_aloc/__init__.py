@@ -5,6 +5,7 @@ from bpy.utils import unregister_class
 from . import bl_import_aloc
 
 from .. import BlenderUI
+from .. import timing
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 
 from bpy.props import (
@@ -70,7 +71,7 @@ class AlocProperties(PropertyGroup):
     )
 
 
-class ImportALOC(bpy.types.Operator, ImportHelper):
+class ImportALOC(bpy.types.Operator, ImportHelper, BlenderUI.BatchOperator):
     """Load a collision .aloc file"""
 
     bl_idname = "import_collision.aloc"
@@ -87,11 +88,28 @@ class ImportALOC(bpy.types.Operator, ImportHelper):
         type=bpy.types.OperatorFileListElement,
     )
 
+    report_timing: BoolProperty(
+        name="Report Timing",
+        description="Report the time spent per import stage in the Info editor",
+        default=False,
+    )
+
+    timing_report_path: StringProperty(
+        name="Timing File",
+        description="Optional .json or .csv file the timing report is written to",
+        subtype="FILE_PATH",
+    )
+
     def draw(self, context):
         if ".aloc" not in self.filepath.lower():
             return
 
         layout = self.layout
+        row = layout.row(align=True)
+        row.prop(self, "report_timing")
+        row = layout.row(align=True)
+        row.enabled = self.report_timing
+        row.prop(self, "timing_report_path")
 
         layout.row(align=True)
 
@@ -100,9 +118,25 @@ class ImportALOC(bpy.types.Operator, ImportHelper):
             os.path.join(os.path.dirname(self.filepath), aloc_paths.name)
             for aloc_paths in self.files
         ]
+        return self.run_batch(
+            context, self.import_steps(aloc_paths), len(aloc_paths), "Importing ALOC"
+        )
+
+    def import_steps(self, aloc_paths):
+        """Imports the given ALOC files, yields after every file"""
+        report = None
+        if self.report_timing:
+            report = timing.TimingReport("ALOC import")
+
+        result = yield from self.import_alocs(aloc_paths, report)
+        timing.output(self, report, self.timing_report_path)
+        return result
+
+    def import_alocs(self, aloc_paths, report=None):
         for aloc_path in aloc_paths:
+            timing.begin(report, aloc_path)
             aloc_result = bl_import_aloc.load_aloc(
-                self, context, aloc_path, True
+                self, bpy.context, aloc_path, True, report
             )
 
             if aloc_result == -1:
@@ -113,6 +147,7 @@ class ImportALOC(bpy.types.Operator, ImportHelper):
 
             layer = bpy.context.view_layer
             layer.update()
+            yield
 
         return {"FINISHED"}
 
@@ -0,0 +1,235 @@
+"""
+Bindings for the alocgen library that cooks ALOC files.
+The library keeps the physics it is building in global state, so only one ALOC can be cooked per process at a time.
+AlocJob records the colliders as plain data, which lets an export cook several ALOCs in parallel subprocesses:
+
+    python alocgen.py job.pickle
+
+This module does not import Blender or anything else from the addon, so it can run as that subprocess.
+"""
+
+import ctypes
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+
+library = None
+library_lock = threading.Lock()
+
+
+class PhysicsCollisionSettings(ctypes.Structure):
+    _fields_ = [
+        ("data_type", ctypes.c_uint32),
+        ("collider_type", ctypes.c_uint32),
+    ]
+
+
+def load_library():
+    """Loads the alocgen library of this platform once and declares its functions"""
+    global library
+    if library is not None:
+        return library
+
+    lib_dir = os.path.abspath(os.path.dirname(__file__))
+    if not os.environ["PATH"].startswith(lib_dir):
+        os.environ["PATH"] = lib_dir + os.pathsep + os.environ["PATH"]
+    if platform.system() == "Linux":
+        lib = ctypes.CDLL(os.path.join(lib_dir, "libalocgen.so"), winmode=0)
+    elif platform.system() == "Windows":
+        lib = ctypes.CDLL(os.path.join(lib_dir, "alocgen.dll"), winmode=0)
+    else:
+        print(f"\n\n\n\nError: {platform.system()} is unsupported\n\n\n\n")
+        return None
+
+    lib.AddConvexMesh.argtypes = (
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_uint32),
+        ctypes.c_uint64,
+    )
+    lib.AddConvexMesh.restype = ctypes.c_int
+    lib.AddTriangleMesh.argtypes = (
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.c_uint32,
+        ctypes.POINTER(ctypes.c_uint32),
+        ctypes.c_uint64,
+    )
+    lib.AddTriangleMesh.restype = ctypes.c_int
+    lib.AddPrimitiveBox.argtypes = (
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.c_uint64,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.POINTER(ctypes.c_float),
+    )
+    lib.AddPrimitiveBox.restype = ctypes.c_int
+    lib.AddPrimitiveCapsule.argtypes = (
+        ctypes.c_float,
+        ctypes.c_float,
+        ctypes.c_uint64,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.POINTER(ctypes.c_float),
+    )
+    lib.AddPrimitiveCapsule.restype = ctypes.c_int
+    lib.AddPrimitiveSphere.argtypes = (
+        ctypes.c_float,
+        ctypes.c_uint64,
+        ctypes.POINTER(ctypes.c_float),
+        ctypes.POINTER(ctypes.c_float),
+    )
+    lib.AddPrimitiveSphere.restype = ctypes.c_int
+    lib.SetCollisionSettings.argtypes = (ctypes.POINTER(PhysicsCollisionSettings),)
+    lib.SetCollisionSettings.restype = ctypes.c_int
+
+    library = lib
+    return library
+
+
+def float_array(values):
+    return (ctypes.c_float * len(values))(*values)
+
+
+class AlocJob:
+    """
+    Records the collision settings and colliders of an ALOC without touching the library.
+    Uses the same add functions as format.Physics, cook or cook_in_subprocess writes the file
+    """
+
+    def __init__(self):
+        self.data_type = 0
+        self.collider_type = 0
+        self.shapes = []
+
+    def set_collision_settings(self, settings):
+        self.data_type = settings.data_type
+        self.collider_type = settings.collider_type
+
+    def add_convex_mesh(self, vertices_list, indices_list, collider_layer):
+        self.shapes.append(("convex", list(vertices_list), list(indices_list), collider_layer))
+
+    def add_triangle_mesh(self, vertices_list, indices_list, collider_layer):
+        self.shapes.append(("triangle", list(vertices_list), list(indices_list), collider_layer))
+
+    def add_primitive_box(
+        self, half_extents_list, collider_layer, position_list, rotation_list
+    ):
+        self.shapes.append(
+            ("box", half_extents_list, collider_layer, position_list, rotation_list)
+        )
+
+    def add_primitive_capsule(
+        self, radius, length, collider_layer, position_list, rotation_list
+    ):
+        self.shapes.append(
+            ("capsule", radius, length, collider_layer, position_list, rotation_list)
+        )
+
+    def add_primitive_sphere(self, radius, collider_layer, position_list, rotation_list):
+        self.shapes.append(
+            ("sphere", radius, collider_layer, position_list, rotation_list)
+        )
+
+    def to_dict(self):
+        return {
+            "data_type": self.data_type,
+            "collider_type": self.collider_type,
+            "shapes": self.shapes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls()
+        job.data_type = data["data_type"]
+        job.collider_type = data["collider_type"]
+        job.shapes = data["shapes"]
+        return job
+
+    def cook(self, filepath):
+        """Cooks the ALOC in this process, calls are serialized because of the global state of the library"""
+        with library_lock:
+            lib = load_library()
+            lib.NewPhysics()
+            settings = PhysicsCollisionSettings()
+            settings.data_type = self.data_type
+            settings.collider_type = self.collider_type
+            lib.SetCollisionSettings(ctypes.byref(settings))
+
+            for shape in self.shapes:
+                kind = shape[0]
+                if kind in ("convex", "triangle"):
+                    _, vertices, indices, layer = shape
+                    add = lib.AddConvexMesh if kind == "convex" else lib.AddTriangleMesh
+                    add(
+                        len(vertices),
+                        float_array(vertices),
+                        int(len(indices) / 3),
+                        (ctypes.c_uint32 * len(indices))(*indices),
+                        layer,
+                    )
+                elif kind == "box":
+                    _, half_extents, layer, position, rotation = shape
+                    lib.AddPrimitiveBox(
+                        float_array(half_extents),
+                        layer,
+                        float_array(position),
+                        float_array(rotation),
+                    )
+                elif kind == "capsule":
+                    _, radius, length, layer, position, rotation = shape
+                    lib.AddPrimitiveCapsule(
+                        radius, length, layer, float_array(position), float_array(rotation)
+                    )
+                elif kind == "sphere":
+                    _, radius, layer, position, rotation = shape
+                    lib.AddPrimitiveSphere(
+                        radius, layer, float_array(position), float_array(rotation)
+                    )
+
+            lib.Write(os.fsencode(filepath))
+
+    def cook_in_subprocess(self, filepath):
+        """
+        Cooks the ALOC in a separate Python process so several ALOCs can be cooked at once.
+        Falls back to cooking in this process only when the process cannot be started,
+        raises a RuntimeError when the cooking itself failed, so a crashing library never runs inside Blender
+        """
+        fd, job_path = tempfile.mkstemp(suffix=".pickle")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(
+                    {"job": self.to_dict(), "filepath": os.fsencode(filepath)}, f
+                )
+            try:
+                result = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), job_path],
+                    capture_output=True,
+                    text=True,
+                )
+            except OSError as err:
+                print("Could not start the ALOC cooking process: " + str(err))
+                self.cook(filepath)
+                return
+        finally:
+            os.remove(job_path)
+
+        if result.returncode != 0:
+            raise RuntimeError(
+                "Cooking %s failed (exit code %d):\n%s"
+                % (os.fsdecode(filepath), result.returncode, result.stderr)
+            )
+
+
+def main(argv):
+    with open(argv[1], "rb") as f:
+        data = pickle.load(f)
+    AlocJob.from_dict(data["job"]).cook(data["filepath"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -5,6 +5,7 @@ import numpy as np
 import mathutils as mu
 
 from . import format as aloc_format
+from .. import mesh_cache
 
 
 def save_aloc(
@@ -28,6 +29,7 @@ def save_aloc(
         else:
             collections.append(selected_collection)
 
+    meshes = mesh_cache.MeshCache()
     for collection in collections:
         mesh_obs = [o for o in collection.all_objects if o.type == "MESH"]
 
@@ -47,7 +49,9 @@ def save_aloc(
             aloc.set_collision_settings(collision_settings)
             for ob in mesh_obs:
                 if ob.name.startswith("ConvexMeshCollider"):
-                    vertices, indices = get_vertices_and_indices(ob)
+                    vertices, indices = get_vertices_and_indices(
+                        meshes.get(ob, attributes=False)
+                    )
                     aloc.add_convex_mesh(
                         vertices,
                         indices,
@@ -57,7 +61,9 @@ def save_aloc(
                     del vertices
                     del indices
                 elif ob.name.startswith("TriangleMeshCollider"):
-                    vertices, indices = get_vertices_and_indices(ob)
+                    vertices, indices = get_vertices_and_indices(
+                        meshes.get(ob, attributes=False)
+                    )
                     aloc.add_triangle_mesh(
                         vertices,
                         indices,
@@ -101,55 +107,17 @@ def save_aloc(
     return {"FINISHED"}
 
 
-def get_positions(mesh, matrix):
-    # read the vertex locations
-    locs = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
-    source = mesh.vertices
-
-    for vert in source:
-        vert.co = matrix @ vert.co
-
-    source.foreach_get("co", locs)
-    locs = locs.reshape(len(mesh.vertices), 3)
-    locs = np.c_[locs, np.ones(len(mesh.vertices), dtype=int)]
-
-    return locs
-
-
-def get_vertices_and_indices(blender_obj):
-    if len(blender_obj.modifiers) == 0:
-        mesh = blender_obj.to_mesh()
-    else:
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        mesh_owner = blender_obj.evaluated_get(depsgraph)
-        mesh = mesh_owner.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-
-    locs = get_positions(mesh, blender_obj.matrix_world.copy())
-
-    dot_fields = [("vertex_index", np.uint32)]
-
-    dots = np.empty(len(mesh.loops), dtype=np.dtype(dot_fields))
-
-    vidxs = np.empty(len(mesh.loops))
-    mesh.loops.foreach_get("vertex_index", vidxs)
-    dots["vertex_index"] = vidxs
-    del vidxs
-
-    # Calculate triangles and sort them into primitives.
-    mesh.calc_loop_triangles()
-    loop_indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
-    mesh.loop_triangles.foreach_get("loops", loop_indices)
-
-    prim_dots = dots[loop_indices]
-    prim_dots, indices = np.unique(prim_dots, return_inverse=True)
-    indices = indices.tolist()
+def get_vertices_and_indices(evaluated):
+    """
+    Returns the flat world space vertex positions and the triangle indices of an EvaluatedMesh,
+    vertices are shared between triangles when they use the same Blender vertex
+    """
+    used_vertices, indices = np.unique(
+        evaluated.vertex_indices[evaluated.loop_triangles], return_inverse=True
+    )
+    indices = indices.reshape(-1).tolist()
 
-    blender_idxs = prim_dots["vertex_index"]
-    vertices = np.empty((len(prim_dots), 3), dtype=np.float32)
-    vertices[:, 0] = locs[blender_idxs, 0]
-    vertices[:, 1] = locs[blender_idxs, 1]
-    vertices[:, 2] = locs[blender_idxs, 2]
-    vertices = vertices.tolist()
-    vertices = [i for v in vertices for i in v]
+    vertices = evaluated.locs[used_vertices, :3].astype(np.float32)
+    vertices = vertices.reshape(-1).tolist()
 
     return vertices, indices
@@ -3,6 +3,10 @@ from .format import PhysicsCollisionType, PhysicsDataType, PhysicsCollisionPrimi
 import bpy
 import bmesh
 import math
+import os
+import time
+
+from .. import timing
 
 
 def log(level, msg, filter_field):
@@ -263,11 +267,13 @@ def load_primitive_mesh_objects(aloc, aloc_name, collection, context, include_no
     return objects
 
 
-def load_aloc(operator, context, filepath, include_non_collidable_layers):
-    """Imports an ALOC mesh from the given path"""
+def load_aloc(operator, context, filepath, include_non_collidable_layers, report=None):
+    """Imports an ALOC mesh from the given path, timings are added to report when given"""
 
     aloc_name = bpy.path.display_name_from_filepath(filepath)
-    aloc = read_aloc(filepath)
+    with timing.stage(report, "read"):
+        aloc = read_aloc(filepath)
+    timing.count(report, bytes=os.path.getsize(filepath))
     if aloc == -1:
         log("ERROR", "Failed to read Mesh ALOC file " + filepath, "load_aloc")
         return -1
@@ -275,6 +281,7 @@ def load_aloc(operator, context, filepath, include_non_collidable_layers):
 
     log("DEBUG", "Converting ALOC: " + aloc_name + " to blender mesh.", aloc_name)
 
+    mesh_start = time.perf_counter()
     collection = bpy.data.collections.new(aloc_name)
     bpy.context.scene.collection.children.link(collection)
     collection.prim_collection_properties.physics_data_type = str(PhysicsDataType(aloc.data_type))
@@ -304,4 +311,6 @@ def load_aloc(operator, context, filepath, include_non_collidable_layers):
         log("ERROR", "Unknown data type: " + str(aloc.data_type) + " for Mesh ALOC " + aloc_name, "load_aloc")
         return -1
 
+    timing.add_time(report, "mesh", time.perf_counter() - mesh_start)
+    timing.count(report, objects=len(collection.objects))
     log("DEBUG", "Finished converting ALOC: " + aloc_name + " to blender mesh.", aloc_name)
@@ -3,10 +3,11 @@ import os
 import bpy
 import sys
 import ctypes
-import platform
 import struct
 
 from .. import io_binary
+from .alocgen import PhysicsCollisionSettings
+from . import alocgen
 
 
 class PhysicsDataType(enum.IntEnum):
@@ -72,13 +73,6 @@ class PhysicsCollisionPrimitiveType(enum.IntEnum):
     NONE = 3
 
 
-class PhysicsCollisionSettings(ctypes.Structure):
-    _fields_ = [
-        ("data_type", ctypes.c_uint32),
-        ("collider_type", ctypes.c_uint32),
-    ]
-
-
 class ConvexMesh:
     def __init__(self):
         self.collision_layer = 0
@@ -465,68 +459,7 @@ class Physics:
         self.primitive_spheres_count = 0
         self.shatters = []
         self.shatter_count = 0
-        if not os.environ["PATH"].startswith(
-                os.path.abspath(os.path.dirname(__file__))
-        ):
-            os.environ["PATH"] = (
-                    os.path.abspath(os.path.dirname(__file__))
-                    + os.pathsep
-                    + os.environ["PATH"]
-            )
-        if platform.system() == "Linux":
-            self.lib = ctypes.CDLL(
-                os.path.abspath(os.path.join(os.path.dirname(__file__), "libalocgen.so")),
-                winmode=0,
-            )
-        elif platform.system() == "Windows":
-            self.lib = ctypes.CDLL(
-                os.path.abspath(os.path.join(os.path.dirname(__file__), "alocgen.dll")),
-                winmode=0,
-            )
-        else:
-            print(f"\n\n\n\nError: {platform.system()} is unsupported\n\n\n\n")
-        self.lib.AddConvexMesh.argtypes = (
-            ctypes.c_uint32,
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.c_uint32,
-            ctypes.POINTER(ctypes.c_uint32),
-            ctypes.c_uint64,
-        )
-        self.lib.AddConvexMesh.restype = ctypes.c_int
-        self.lib.AddTriangleMesh.argtypes = (
-            ctypes.c_uint32,
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.c_uint32,
-            ctypes.POINTER(ctypes.c_uint32),
-            ctypes.c_uint64,
-        )
-        self.lib.AddTriangleMesh.restype = ctypes.c_int
-        self.lib.AddPrimitiveBox.argtypes = (
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.c_uint64,
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.POINTER(ctypes.c_float),
-        )
-        self.lib.AddPrimitiveBox.restype = ctypes.c_int
-        self.lib.AddPrimitiveCapsule.argtypes = (
-            ctypes.c_float,
-            ctypes.c_float,
-            ctypes.c_uint64,
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.POINTER(ctypes.c_float),
-        )
-        self.lib.AddPrimitiveCapsule.restype = ctypes.c_int
-        self.lib.AddPrimitiveSphere.argtypes = (
-            ctypes.c_float,
-            ctypes.c_uint64,
-            ctypes.POINTER(ctypes.c_float),
-            ctypes.POINTER(ctypes.c_float),
-        )
-        self.lib.AddPrimitiveSphere.restype = ctypes.c_int
-        self.lib.SetCollisionSettings.argtypes = (
-            ctypes.POINTER(PhysicsCollisionSettings),
-        )
-        self.lib.SetCollisionSettings.restype = ctypes.c_int
+        self.lib = alocgen.load_library()
         self.lib.NewPhysics()
 
     def write(self, filepath):
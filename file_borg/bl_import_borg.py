@@ -1,4 +1,6 @@
 import os
+import io
+import hashlib
 import bpy
 import mathutils
 import math
@@ -222,18 +224,85 @@ def init_bones(borg, bones):
             bones[bone.prev_bone_nr].children.append(i)
 
 
-def load_borg(operator, context, filepath):
+class CachedRig:
+    """A parsed BoneRig and its computed bones, shared by every import within a session"""
+
+    def __init__(self, key, borg, bones):
+        self.key = key
+        self.borg = borg
+        self.bones = bones
+        self.armature_name = None
+        self.object_name = None
+
+
+# (rig path, content hash) -> CachedRig
+rig_cache = {}
+
+
+def get_rig(filepath):
+    """
+    Returns the CachedRig of the given BORG file.
+    The file is only parsed again when its content changed since it was last read
+    """
     fp = os.fsencode(filepath)
-    file = open(fp, "rb")
-    br = io_binary.BinaryReader(file)
+    with open(fp, "rb") as file:
+        data = file.read()
 
-    borg_name = bpy.path.display_name_from_filepath(filepath)
+    key = (
+        os.path.normcase(os.path.abspath(filepath)),
+        hashlib.blake2b(data, digest_size=16).hexdigest(),
+    )
+    if key in rig_cache:
+        return rig_cache[key]
 
-    amt = bpy.data.armatures.new(borg_name)
+    br = io_binary.BinaryReader(io.BytesIO(data))
     borg = format.BoneRig()
     borg.read(br)
 
-    bones = compute_bones(borg)
+    rig = CachedRig(key, borg, compute_bones(borg))
+    rig_cache[key] = rig
+    return rig
+
+
+def is_cached_rig_data(data, rig):
+    return data is not None and data.get("glacier_rig_key") == rig.key[1]
+
+
+def load_borg_object(operator, context, filepath, shared: bool = False):
+    """
+    Returns an armature object using the armature of the given BORG file.
+    When shared is set the same object is returned for as long as it exists
+    """
+    rig = get_rig(filepath)
+    if shared and rig.object_name is not None:
+        blender_arma = bpy.data.objects.get(rig.object_name)
+        if blender_arma is not None and is_cached_rig_data(blender_arma.data, rig):
+            return blender_arma
+
+    armature = load_borg(operator, context, filepath, shared)
+    blender_arma = bpy.data.objects.new(armature.name, armature)
+
+    if shared:
+        rig.object_name = blender_arma.name
+    return blender_arma
+
+
+def load_borg(operator, context, filepath, shared: bool = False):
+    """
+    Returns the armature of the given BORG file.
+    The armature is built once per rig, later imports of the same rig get that armature when shared is set
+    and a copy of it otherwise, so editing one unshared rig does not change the others
+    """
+    rig = get_rig(filepath)
+    if rig.armature_name is not None:
+        amt = bpy.data.armatures.get(rig.armature_name)
+        if is_cached_rig_data(amt, rig):
+            return amt if shared else amt.copy()
+
+    borg_name = bpy.path.display_name_from_filepath(filepath)
+
+    amt = bpy.data.armatures.new(borg_name)
+    bones = rig.bones
 
     # for constr in borg.bone_constraints.bone_constraints:
     #    print(borg.bone_definitions[constr.bone_index].name)
@@ -299,4 +368,7 @@ def load_borg(operator, context, filepath):
 
     amt = blender_arma.data
     bpy.data.objects.remove(blender_arma)
-    return amt
+
+    amt["glacier_rig_key"] = rig.key[1]
+    rig.armature_name = amt.name
+    return amt if shared else amt.copy()
@@ -1,6 +1,7 @@
 import enum
 import os
 import sys
+import copy
 import json
 
 
@@ -8,6 +9,8 @@ class Materials:
     def __init__(self):
         self.dir = os.path.abspath(os.path.dirname(__file__)) + os.sep + "materials"
         self.materials = {}
+        # material name -> MaterialTemplate, compiled on first use
+        self.templates = {}
         for file in os.listdir(self.dir):
             if file.lower().endswith(".json"):
                 with open(self.dir + os.sep + file, "r", encoding="utf-8") as f:
@@ -57,3 +60,130 @@ class Materials:
                 if "Class" in self.materials[m]["Flags"]:
                     return self.materials[m]["Flags"]["Class"]
         return []
+
+    def get_template(self, material_name):
+        """Returns the compiled MaterialTemplate of a material class, compiled on first use"""
+        if material_name not in self.materials:
+            return None
+        template = self.templates.get(material_name)
+        if template is None:
+            template = MaterialTemplate(self.materials[material_name])
+            self.templates[material_name] = template
+        return template
+
+
+TEXTURE_PLACEHOLDERS = ("diffuse", "normal", "specular")
+
+
+class MaterialTemplate:
+    """
+    A material class json without the FriendlyName keys, along with the position of every value a material fills in.
+    fill only copies the containers it changes, everything else is shared with the template
+    """
+
+    def __init__(self, material_json):
+        self.base = copy.deepcopy(material_json)
+        binder = self.base["Material"]["Instance"][0]["Binder"][0]
+        for key in ("Texture", "Float Value", "Color"):
+            for value in binder.get(key, []):
+                value.pop("FriendlyName", None)
+
+        self.texture_slots = [
+            (i, texture["Texture Id"])
+            for i, texture in enumerate(binder.get("Texture", []))
+            if texture["Texture Id"] in TEXTURE_PLACEHOLDERS
+        ]
+        self.float_slots = get_name_slots(binder.get("Float Value", []))
+        self.color_slots = get_name_slots(binder.get("Color", []))
+
+        overrides = self.base["Overrides"]
+        self.override_texture_slots = [
+            (key, texture_id)
+            for key, texture_id in overrides["Texture"].items()
+            if texture_id in TEXTURE_PLACEHOLDERS
+        ]
+
+    def fill(self, material):
+        """Returns the material json of a material exported with this material class"""
+        # the binder takes the last value of a name, the overrides look the name up and take the first
+        floats = {f.name: f.value for f in material["floats"]}
+        colors = {c.name: [c.value.r, c.value.g, c.value.b] for c in material["colors"]}
+        override_floats = {f.name: f.value for f in reversed(material["floats"])}
+        override_colors = {
+            c.name: [c.value.r, c.value.g, c.value.b] for c in reversed(material["colors"])
+        }
+
+        material_json = dict(self.base)
+        material_json["MATI"] = material["ioi_path"]
+        material_json["MATT"] = material["ioi_path_entitytype"]
+        material_json["MATB"] = material["ioi_path_entityblueprint"]
+        material_json["ERES"] = material["ERES"]
+
+        material_json["Material"] = dict(self.base["Material"])
+        instances = list(self.base["Material"]["Instance"])
+        instance = dict(instances[0])
+        instance["Name"] = material["name"]
+        binders = list(instance["Binder"])
+        binder = dict(binders[0])
+
+        if self.texture_slots:
+            textures = list(binder["Texture"])
+            for i, texture_id in self.texture_slots:
+                textures[i] = dict(textures[i])
+                textures[i]["Texture Id"] = material.get(texture_id, "")
+                if texture_id == "diffuse" and "diffuse" in material:
+                    print("Diffuse: " + material["diffuse"])
+            binder["Texture"] = textures
+        binder = fill_name_slots(binder, "Float Value", self.float_slots, floats)
+        binder = fill_name_slots(binder, "Color", self.color_slots, colors)
+
+        binders[0] = binder
+        instance["Binder"] = binders
+        instances[0] = instance
+        material_json["Material"]["Instance"] = instances
+
+        # Flags section
+        material_json["Flags"] = dict(self.base["Flags"])
+        for section, key in (("Class", "class_flags"), ("Instance", "instance_flags")):
+            flags = dict(material_json["Flags"][section])
+            for flag in material[key]:
+                flags[flag["name"]] = True if flag["value"] == 1 else False
+            material_json["Flags"][section] = flags
+
+        # Overrides section
+        overrides = dict(self.base["Overrides"])
+        override_textures = dict(overrides["Texture"])
+        for key, texture_id in self.override_texture_slots:
+            override_textures[key] = material.get(texture_id, "")
+        overrides["Texture"] = override_textures
+        for float_key in self.base["Overrides"]:
+            if float_key in override_floats:
+                overrides[float_key] = override_floats[float_key]
+        overrides["Color"] = dict(overrides["Color"])
+        for color_key in self.base["Overrides"]["Color"]:
+            if color_key in override_colors:
+                overrides["Color"][color_key] = override_colors[color_key]
+        material_json["Overrides"] = overrides
+
+        return material_json
+
+
+def get_name_slots(values):
+    """Maps the Name of every value to the positions it is found at"""
+    slots = {}
+    for i, value in enumerate(values):
+        slots.setdefault(value["Name"], []).append(i)
+    return slots
+
+
+def fill_name_slots(binder, key, slots, values):
+    """Returns the binder with the values of the named slots replaced, untouched slots stay shared"""
+    if not slots or not values:
+        return binder
+    entries = list(binder[key])
+    for name, value in values.items():
+        for i in slots.get(name, []):
+            entries[i] = dict(entries[i])
+            entries[i]["Value"] = value
+    binder[key] = entries
+    return binder
@@ -3,6 +3,7 @@ import os
 
 from . import bl_utils_prim
 from .. import BlenderUI
+from .. import timing
 from ..file_aloc import format as aloc_format
 from ..file_mat import materials as mat_materials
 import mathutils
@@ -33,7 +34,7 @@ from bpy.types import (
 materials = mat_materials.Materials()
 
 
-class ImportPRIM(bpy.types.Operator, ImportHelper):
+class ImportPRIM(bpy.types.Operator, ImportHelper, BlenderUI.BatchOperator):
     """Load a PRIM file"""
 
     bl_idname = "import_mesh.prim"
@@ -59,6 +60,48 @@ class ImportPRIM(bpy.types.Operator, ImportHelper):
         description="Path to the BoneRig (BORG) file",
     )
 
+    share_rig: BoolProperty(
+        name="Share BoneRig",
+        description="Use a single armature object for all imported PRIMs that use the same BoneRig",
+        default=True,
+    )
+
+    placeholders: BoolProperty(
+        name="Placeholders Only",
+        description="Only create bounding box placeholders from the PRIM headers.\nThe geometry can be loaded later from the Glacier settings panel",
+        default=False,
+    )
+
+    instance_meshes: BoolProperty(
+        name="Instance Repeated Meshes",
+        description="Link identical sub meshes to the mesh that was already imported in this session instead of building a new one.\nThe objects share their mesh data, editing one edits all of them",
+        default=False,
+    )
+
+    fast_validation: BoolProperty(
+        name="Fast Validation",
+        description="Check the imported meshes with fast vectorized checks and only run Blender's full mesh validation when they find a problem",
+        default=True,
+    )
+
+    report_timing: BoolProperty(
+        name="Report Timing",
+        description="Report the time spent per import stage in the Info editor",
+        default=False,
+    )
+
+    timing_report_path: StringProperty(
+        name="Timing File",
+        description="Optional .json or .csv file the timing report is written to",
+        subtype="FILE_PATH",
+    )
+
+    report_instancing: BoolProperty(
+        name="Report Instancing",
+        description="Report how many meshes were reused instead of rebuilt",
+        default=False,
+    )
+
     use_aloc: BoolProperty(
         name="Use Collision", description="Use a ALOC file on the chosen prim file"
     )
@@ -80,14 +123,15 @@ class ImportPRIM(bpy.types.Operator, ImportHelper):
                 layout.label(
                     text="The selected prim does not support a rig", icon="ERROR"
                 )
-            elif len(self.files) - 1:
-                layout.label(text="Rigs are not supported when batch importing")
             else:
                 row = layout.row(align=True)
                 row.prop(self, "use_rig")
                 row = layout.row(align=True)
                 row.enabled = self.use_rig
                 row.prop(self, "rig_filepath")
+                row = layout.row(align=True)
+                row.enabled = self.use_rig
+                row.prop(self, "share_rig")
 
                 if self.use_rig:
                     f = None
@@ -101,16 +145,83 @@ class ImportPRIM(bpy.types.Operator, ImportHelper):
                         if f:
                             f.close()
 
+        row = layout.row(align=True)
+        row.prop(self, "placeholders")
+        row = layout.row(align=True)
+        row.prop(self, "fast_validation")
+        row = layout.row(align=True)
+        row.prop(self, "instance_meshes")
+        row = layout.row(align=True)
+        row.enabled = self.instance_meshes
+        row.prop(self, "report_instancing")
+        row = layout.row(align=True)
+        row.prop(self, "report_timing")
+        row = layout.row(align=True)
+        row.enabled = self.report_timing
+        row.prop(self, "timing_report_path")
+
         layout.row(align=True)
 
     def execute(self, context):
-        from . import bl_import_prim
-
         prim_paths = [
             os.path.join(os.path.dirname(self.filepath), meshPaths.name)
             for meshPaths in self.files
         ]
-        for prim_path in prim_paths:
+        return self.run_batch(
+            context, self.import_steps(prim_paths), len(prim_paths), "Importing PRIM"
+        )
+
+    def import_steps(self, prim_paths):
+        """Imports the given PRIM files, yields after every file"""
+        report = None
+        if self.report_timing:
+            report = timing.TimingReport("PRIM import")
+
+        result = yield from self.import_prims(prim_paths, report)
+        timing.output(self, report, self.timing_report_path)
+        return result
+
+    def import_prims(self, prim_paths, report=None):
+        from . import bl_import_prim
+
+        context = bpy.context
+        instancing = None
+        if self.instance_meshes:
+            instancing = bl_import_prim.InstancingReport()
+
+        if self.placeholders:
+            for prim_path in prim_paths:
+                timing.begin(report, prim_path)
+                collection = bpy.data.collections.new(
+                    bpy.path.display_name_from_filepath(prim_path)
+                )
+                self.rig_filepath = self.rig_filepath.replace(os.sep, "/")
+
+                arma_obj = None
+                if self.use_rig:
+                    from ..file_borg import bl_import_borg
+
+                    with timing.stage(report, "rig"):
+                        arma_obj = bl_import_borg.load_borg_object(
+                            self, context, self.rig_filepath, self.share_rig
+                        )
+                    if not arma_obj.users_collection:
+                        collection.objects.link(arma_obj)
+
+                for obj in bl_import_prim.load_prim_placeholders(
+                    prim_path,
+                    collection,
+                    self.rig_filepath if self.use_rig else "",
+                    arma_obj,
+                    self.instance_meshes,
+                ):
+                    collection.objects.link(obj)
+                context.scene.collection.children.link(collection)
+                yield
+            return {"FINISHED"}
+
+        for prim_path, prim in bl_import_prim.read_prims(prim_paths):
+            timing.begin(report, prim_path)
             collection = bpy.data.collections.new(
                 bpy.path.display_name_from_filepath(prim_path)
             )
@@ -121,12 +232,24 @@ class ImportPRIM(bpy.types.Operator, ImportHelper):
             if self.use_rig:
                 from ..file_borg import bl_import_borg
 
-                armature = bl_import_borg.load_borg(self, context, self.rig_filepath)
-                arma_obj = bpy.data.objects.new(armature.name, armature)
-                collection.objects.link(arma_obj)
+                with timing.stage(report, "rig"):
+                    arma_obj = bl_import_borg.load_borg_object(
+                        self, context, self.rig_filepath, self.share_rig
+                    )
+                if not arma_obj.users_collection:
+                    collection.objects.link(arma_obj)
 
             objects = bl_import_prim.load_prim(
-                self, context, collection, prim_path, self.use_rig, self.rig_filepath
+                self,
+                context,
+                collection,
+                prim_path,
+                self.use_rig,
+                self.rig_filepath,
+                prim,
+                instancing,
+                self.fast_validation,
+                report,
             )
 
             if not objects:
@@ -135,25 +258,31 @@ class ImportPRIM(bpy.types.Operator, ImportHelper):
                 )
                 return {"CANCELLED"}
 
-            for obj in objects:
-                if self.use_rig and arma_obj:
-                    obj.modifiers.new(name="Glacier Bonerig", type="ARMATURE")
-                    obj.modifiers["Glacier Bonerig"].object = arma_obj
+            with timing.stage(report, "link"):
+                for obj in objects:
+                    if self.use_rig and arma_obj:
+                        obj.modifiers.new(name="Glacier Bonerig", type="ARMATURE")
+                        obj.modifiers["Glacier Bonerig"].object = arma_obj
 
-                obj.data.polygons.foreach_set(
-                    "use_smooth", [True] * len(obj.data.polygons)
-                )
+                    obj.data.polygons.foreach_set(
+                        "use_smooth", [True] * len(obj.data.polygons)
+                    )
+
+                    collection.objects.link(obj)
 
-                collection.objects.link(obj)
+                context.scene.collection.children.link(collection)
+                layer = bpy.context.view_layer
+                layer.update()
+            yield
 
-            context.scene.collection.children.link(collection)
-            layer = bpy.context.view_layer
-            layer.update()
+        if instancing is not None and self.report_instancing:
+            print(instancing.summary())
+            self.report({"INFO"}, instancing.summary())
 
         return {"FINISHED"}
 
 
-class ExportPRIM(bpy.types.Operator, ExportHelper):
+class ExportPRIM(bpy.types.Operator, ExportHelper, BlenderUI.BatchOperator):
     """Export to a PRIM file"""
 
     bl_idname = "export_mesh.prim"
@@ -227,6 +356,53 @@ class ExportPRIM(bpy.types.Operator, ExportHelper):
         default=False,
     )
 
+    hitbox_ordering: EnumProperty(
+        name="Hitbox Ordering",
+        description="Reorders the triangles before they are grouped into hitbox chunks.\nSpatially coherent chunks give tighter hitboxes",
+        items=[
+            ("NONE", "None", "Keep the triangle order of the mesh"),
+            ("MORTON", "Morton", "Sort the triangles along a Z-order curve"),
+            ("SAH", "SAH", "Split the triangles using the surface area heuristic"),
+        ],
+        default="NONE",
+    )
+
+    optimize_vertex_cache: BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorders triangles and vertices for the GPU vertex cache and reduced overdraw.\nSlows down the export of large meshes",
+        default=False,
+    )
+
+    generate_lods: BoolProperty(
+        name="Generate LODs",
+        description="Generates decimated copies of every mesh and spreads the LOD bits of the mesh over them",
+        default=False,
+    )
+
+    lod_ratios: StringProperty(
+        name="LOD Ratios",
+        description="Comma separated list of triangle ratios, one for each generated LOD.\nUV seams and vertex color borders are preserved where possible",
+        default="0.5, 0.25, 0.125",
+    )
+
+    force_export: BoolProperty(
+        name="Force Full Export",
+        description="Export every collection, even the ones that did not change since the last export",
+        default=False,
+    )
+
+    report_timing: BoolProperty(
+        name="Report Statistics",
+        description="Report the time spent per export stage and the vertex, triangle and byte counts per collection in the Info editor",
+        default=False,
+    )
+
+    timing_report_path: StringProperty(
+        name="Statistics File",
+        description="Optional .json or .csv file the export statistics are written to. The .json file also lists every exported object",
+        subtype="FILE_PATH",
+    )
+
     def draw(self, context):
         if ".prim" not in self.filepath.lower():
             return
@@ -240,7 +416,23 @@ class ExportPRIM(bpy.types.Operator, ExportHelper):
         row = layout.row(align=True)
         row.prop(self, "hitbox_slider")
         row = layout.row(align=True)
+        row.prop(self, "hitbox_ordering")
+        row = layout.row(align=True)
+        row.prop(self, "optimize_vertex_cache")
+        row = layout.row(align=True)
+        row.prop(self, "generate_lods")
+        row = layout.row(align=True)
+        row.enabled = self.generate_lods
+        row.prop(self, "lod_ratios")
+        row = layout.row(align=True)
         row.prop(self, "force_highres_flag")
+        row = layout.row(align=True)
+        row.prop(self, "force_export")
+        row = layout.row(align=True)
+        row.prop(self, "report_timing")
+        row = layout.row(align=True)
+        row.enabled = self.report_timing
+        row.prop(self, "timing_report_path")
         if self.export_scene:
             row = layout.row(align=True)
             row.prop(self, "export_all_collections")
@@ -255,12 +447,39 @@ class ExportPRIM(bpy.types.Operator, ExportHelper):
         from . import bl_export_prim
 
         keywords = self.as_keywords(
-            ignore=("check_existing", "filter_glob", "export_collection")
+            ignore=(
+                "check_existing",
+                "filter_glob",
+                "export_collection",
+                "report_timing",
+                "timing_report_path",
+            )
+        )
+        collection = bpy.data.collections[self.export_collection]
+        collections = bl_export_prim.get_export_collections(
+            collection, self.export_all_collections
+        )
+
+        return self.run_batch(
+            context,
+            self.export_steps(collection, keywords),
+            len(collections),
+            "Exporting PRIM",
         )
 
-        return bl_export_prim.save_prim(
-            bpy.data.collections[self.export_collection], **keywords
+    def export_steps(self, collection, keywords):
+        """Exports the collections, collecting the export statistics when report_timing is set"""
+        from . import bl_export_prim
+
+        report = None
+        if self.report_timing:
+            report = timing.TimingReport("PRIM export")
+
+        result = yield from bl_export_prim.save_prim_steps(
+            collection, report=report, **keywords
         )
+        timing.output(self, report, self.timing_report_path)
+        return result
 
 
 class PrimCollectionProperties(PropertyGroup):
@@ -960,6 +1179,35 @@ class GLACIER_OT_UpdateMaterial(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class GLACIER_OT_LoadPlaceholderGeometry(bpy.types.Operator):
+    bl_idname = "prim.load_placeholder_geometry"
+    bl_label = "Load Placeholder Geometry"
+    bl_description = "Replace the selected PRIM placeholders with their geometry, or all visible placeholders when none are selected"
+
+    def execute(self, context):
+        from . import bl_import_prim
+
+        placeholders = [
+            obj for obj in context.selected_objects if bl_import_prim.is_placeholder(obj)
+        ]
+        if not placeholders:
+            placeholders = [
+                obj
+                for obj in context.visible_objects
+                if bl_import_prim.is_placeholder(obj)
+            ]
+        if not placeholders:
+            self.report({"INFO"}, "No PRIM placeholders to load")
+            return {"CANCELLED"}
+
+        instancing = bl_import_prim.InstancingReport()
+        objects = bl_import_prim.load_placeholder_geometry(placeholders, instancing)
+        self.report({"INFO"}, "Loaded %d of %d placeholders" % (len(objects), len(placeholders)))
+        if instancing.meshes_reused:
+            print(instancing.summary())
+        return {"FINISHED"}
+
+
 class GLACIER_OT_CopyMaterialProperties(bpy.types.Operator):
     bl_idname = "material.copy_properties"
     bl_label = "Copy Material Properties"
@@ -1142,6 +1390,7 @@ classes = [
     PrimMaterialProperties,
     GLACIER_OT_UpdateMaterial,
     GLACIER_OT_CopyMaterialProperties,
+    GLACIER_OT_LoadPlaceholderGeometry,
     GLACIER_PT_PrimMaterialPropertiesPanel,
     GLACIER_PT_PrimMaterialAdvancedPropertiesPanel,
     GLACIER_PT_PrimMaterialInstanceFlagsPanel,
@@ -1159,6 +1408,8 @@ classes = [
 
 
 def register():
+    from . import bl_import_prim
+
     for c in classes:
         bpy.utils.register_class(c)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
@@ -1171,9 +1422,19 @@ def register():
     bpy.types.Material.prim_material_properties = PointerProperty(
         type=PrimMaterialProperties
     )
+    bpy.app.handlers.depsgraph_update_post.append(
+        bl_import_prim.forget_verified_meshes
+    )
+    bpy.app.handlers.load_post.append(bl_import_prim.forget_verified_meshes)
 
 
 def unregister():
+    from . import bl_import_prim
+
+    bpy.app.handlers.depsgraph_update_post.remove(
+        bl_import_prim.forget_verified_meshes
+    )
+    bpy.app.handlers.load_post.remove(bl_import_prim.forget_verified_meshes)
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
@@ -1,23 +1,48 @@
 import os
 import bpy
-import bmesh
 import numpy as np
 import mathutils as mu
-from functools import cmp_to_key
-import copy
-import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import json
-import copy
 
 from . import format
-from .. import io_binary
+from . import optimize
+from . import bl_export_textures
+from . import hashlist
+from . import primgen
+from .hashlist import get_ioi_path_and_hash
 from .. import BlenderUI
+from .. import mesh_cache
+from .. import timing
+from ..file_aloc import alocgen
 from ..file_aloc import format as aloc_format
+from ..file_aloc.bl_export_aloc import get_vertices_and_indices
 from ..file_mat import materials as mat_materials
 
 
-def save_prim(
+def get_export_collections(selected_collection, export_all_collections: bool):
+    """Returns the collections that will be exported as a prim"""
+    if export_all_collections:
+        return list(bpy.data.scenes[0].collection.children)
+    return [selected_collection]
+
+
+def save_prim(*args, **kwargs):
+    """
+    Export the selected collection to a prim, see save_prim_steps for the arguments.
+    Returns "FINISHED" when successful
+    """
+    steps = save_prim_steps(*args, **kwargs)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as result:
+            return result.value
+
+
+def save_prim_steps(
     selected_collection,
     filepath: str,
     hitbox_slider: int,
@@ -27,273 +52,392 @@ def save_prim(
     collection_folders: bool = False,
     export_materials_textures: bool = False,
     export_geomentity: bool = False,
+    hitbox_ordering: str = "NONE",
+    optimize_vertex_cache: bool = False,
+    generate_lods: bool = False,
+    lod_ratios: str = "0.5, 0.25, 0.125",
+    force_export: bool = False,
+    max_workers=None,
+    report=None,
 ):
     """
     Export the selected collection to a prim
     Writes to the given path.
-    Returns "FINISHED" when successful
+    Blender data is only read on the calling thread. The files of every collection are written by a pool
+    of max_workers threads, which run the PRIM encoding and the ALOC cooking in subprocesses.
+    Collections whose fingerprint matches the record of the last export are skipped, unless force_export is set.
+    Timings and counts are added to report, a timing.TimingReport, when given.
+    The textures and hashlist of the collections exported so far are also written when the export stops early,
+    the export records only when it finished.
+    Yields after every extracted collection, returns "FINISHED" when successful
     """
     export_file = os.fsencode(filepath)
+    lod_ratios = parse_lod_ratios(lod_ratios)
     export_dir_original = export_file[: export_file.rfind(os.sep.encode())]
     bpy.context.scene.render.image_settings.file_format = "TARGA"
-    collections = []
+    collections = get_export_collections(selected_collection, export_all_collections)
     material_jsons = mat_materials.Materials()
     hash_list_entries = {}
-
-    if export_all_collections:
-        for collection in bpy.data.scenes[0].collection.children:
-            collections.append(collection)
-    else:
-        collections.append(selected_collection)
-
-    for collection in collections:
-        prim = format.RenderPrimitive()
-        prim.header.bone_rig_resource_index = (
-            collection.prim_collection_properties.bone_rig_resource_index
-        )
-
-        prim.header.object_table = []
-
-        materials = {}
-
-        export_dir = export_dir_original
-        collection_name = collection.name.replace(".", "_")
-        if export_scene:
-            if collection_folders:
-                export_dir += os.sep.encode() + collection_name.encode()
-                if not os.path.exists(export_dir):
-                    os.system('mkdir "' + export_dir.decode() + '"')
-        mesh_obs = [o for o in collection.all_objects if o.type == "MESH"]
-        for ob in mesh_obs:
-            if (
-                not ob.name.startswith("BoxCollider")
-                and not ob.name.startswith("CapsuleCollider")
-                and not ob.name.startswith("SphereCollider")
-                and not ob.name.startswith("ConvexMeshCollider")
-                and not ob.name.startswith("TriangleMeshCollider")
-            ):
-                prim_obj = format.PrimMesh()
-                mesh_backup = ob.data.copy()
-                triangulate_object(ob)
-
-                material_id = ob.data.prim_properties.material_id
-                prim_obj.prim_object.material_id = material_id
-
-                if ob.data.prim_properties.axis_lock[0]:
-                    prim_obj.prim_object.properties.setXaxisLocked()
-
-                if ob.data.prim_properties.axis_lock[1]:
-                    prim_obj.prim_object.properties.setYaxisLocked()
-
-                if ob.data.prim_properties.axis_lock[2]:
-                    prim_obj.prim_object.properties.setZaxisLocked()
-
-                if ob.data.prim_properties.no_physics:
-                    prim_obj.prim_object.properties.setNoPhysics()
-
-                lod = bitArrToInt(ob.data.prim_properties.lod)
-                prim_obj.prim_object.lodmask = lod
-
-                prim_obj.sub_mesh, material_id = save_prim_sub_mesh(
-                    collection_name,
-                    ob,
-                    hitbox_slider[0],
-                    export_dir,
-                    material_id,
-                    export_materials_textures,
-                    materials,
-                    material_jsons,
-                    hash_list_entries,
-                    export_scene,
+    meshes = mesh_cache.MeshCache(report)
+    textures = bl_export_textures.TextureExport(max_workers, report)
+    export_options = (
+        filepath,
+        tuple(hitbox_slider),
+        force_highres_flag,
+        export_scene,
+        collection_folders,
+        export_materials_textures,
+        export_geomentity,
+        hitbox_ordering,
+        optimize_vertex_cache,
+        lod_ratios if generate_lods else None,
+    )
+
+    writes = []
+    # export records are only written once every file of the export was written, see write_export_record
+    records = []
+    # the hashlist entries of the collections whose files were submitted, and the folder they belong in
+    finished_entries = 0
+    finished_export_dir = None
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for collection in collections:
+                timing_item = timing.begin(report, collection.name)
+                prim = format.RenderPrimitive()
+                prim.header.bone_rig_resource_index = (
+                    collection.prim_collection_properties.bone_rig_resource_index
                 )
-                if material_id != -1:
-                    prim_obj.prim_object.material_id = material_id
-
-                if prim_obj.sub_mesh is None:
-                    return {"CANCELLED"}
-                # Set subMesh properties
-                if len(prim_obj.sub_mesh.vertexBuffer.vertices) > 100000:
-                    prim_obj.prim_object.properties.setHighResolution()
-
-                if force_highres_flag:
-                    prim_obj.prim_object.properties.setHighResolution()
 
-                if ob.data.prim_properties.use_mesh_color:
-                    prim_obj.sub_mesh.prim_object.properties.setColor1()
-
-                prim_obj.sub_mesh.prim_object.variant_id = (
-                    ob.data.prim_properties.variant_id
-                )
-                prim_obj.prim_object.zbias = ob.data.prim_properties.z_bias
-                prim_obj.prim_object.zoffset = ob.data.prim_properties.z_offset
-                if ob.data.prim_properties.use_mesh_color:
-                    prim_obj.sub_mesh.prim_object.color1[0] = round(
-                        ob.data.prim_properties.mesh_color[0] * 255
+                prim.header.object_table = []
+
+                materials = {}
+
+                export_dir = export_dir_original
+                collection_name = collection.name.replace(".", "_")
+                if export_scene:
+                    if collection_folders:
+                        export_dir += os.sep.encode() + collection_name.encode()
+                        if not os.path.exists(export_dir):
+                            os.system('mkdir "' + export_dir.decode() + '"')
+                if export_scene:
+                    geom_ioi_path = (
+                        "[assembly:/_pro/environment/geometry/"
+                        + collection_name
+                        + "/"
+                        + collection_name
+                        + ".prim].pc_entitytype"
                     )
-                    prim_obj.sub_mesh.prim_object.color1[1] = round(
-                        ob.data.prim_properties.mesh_color[1] * 255
+                    geom_ioi_path, geom_ioi_hash = get_ioi_path_and_hash(geom_ioi_path)
+                    # print("IOI Hash GEOMENTITY:", geom_ioi_hash)
+                    # print("IOI Path GEOMENTITY:", geom_ioi_path)
+                    hash_list_entry_key = geom_ioi_hash + ".TEMP"
+                    if hash_list_entry_key not in hash_list_entries:
+                        hash_list_entries[hash_list_entry_key] = geom_ioi_path
+                    prim_ioi_path = (
+                        "[assembly:/_pro/environment/materials/"
+                        + collection_name
+                        + "/"
+                        + collection_name
+                        + ".prim].pc_prim"
                     )
-                    prim_obj.sub_mesh.prim_object.color1[2] = round(
-                        ob.data.prim_properties.mesh_color[2] * 255
+                    prim_ioi_path, prim_ioi_hash = get_ioi_path_and_hash(prim_ioi_path)
+                    # print("IOI Hash PRIM:", prim_ioi_hash)
+                    # print("IOI Path PRIM:", prim_ioi_path)
+                    hash_list_entry_key = prim_ioi_hash + ".PRIM"
+                    if hash_list_entry_key not in hash_list_entries:
+                        hash_list_entries[hash_list_entry_key] = prim_ioi_path
+                    aloc_ioi_path = (
+                        "[assembly:/_pro/environment/materials/"
+                        + collection_name
+                        + "/"
+                        + collection_name
+                        + ".prim].pc_coll"
                     )
-                    prim_obj.sub_mesh.prim_object.color1[3] = round(
-                        ob.data.prim_properties.mesh_color[3] * 255
+                    aloc_ioi_path, aloc_ioi_hash = get_ioi_path_and_hash(aloc_ioi_path)
+                    # print("IOI Hash ALOC:", aloc_ioi_hash)
+                    # print("IOI Path ALOC:", aloc_ioi_path)
+                    hash_list_entry_key = aloc_ioi_hash + ".ALOC"
+                    if hash_list_entry_key not in hash_list_entries:
+                        hash_list_entries[hash_list_entry_key] = aloc_ioi_path
+
+                if export_scene:
+                    prim_export_path = (
+                        export_dir + os.sep.encode() + prim_ioi_hash.encode() + b".prim"
                     )
+                else:
+                    prim_export_path = os.fsencode(filepath)
 
-                prim.header.object_table.append(prim_obj)
-                ob.data = mesh_backup
-
-        if export_scene:
-            geom_ioi_path = (
-                "[assembly:/_pro/environment/geometry/"
-                + collection_name
-                + "/"
-                + collection_name
-                + ".prim].pc_entitytype"
-            )
-            geom_ioi_path, geom_ioi_hash = get_ioi_path_and_hash(geom_ioi_path)
-            # print("IOI Hash GEOMENTITY:", geom_ioi_hash)
-            # print("IOI Path GEOMENTITY:", geom_ioi_path)
-            hash_list_entry_key = geom_ioi_hash + ".TEMP"
-            if hash_list_entry_key not in hash_list_entries:
-                hash_list_entries[hash_list_entry_key] = geom_ioi_path
-            prim_ioi_path = (
-                "[assembly:/_pro/environment/materials/"
-                + collection_name
-                + "/"
-                + collection_name
-                + ".prim].pc_prim"
-            )
-            prim_ioi_path, prim_ioi_hash = get_ioi_path_and_hash(prim_ioi_path)
-            # print("IOI Hash PRIM:", prim_ioi_hash)
-            # print("IOI Path PRIM:", prim_ioi_path)
-            hash_list_entry_key = prim_ioi_hash + ".PRIM"
-            if hash_list_entry_key not in hash_list_entries:
-                hash_list_entries[hash_list_entry_key] = prim_ioi_path
-            aloc_ioi_path = (
-                "[assembly:/_pro/environment/materials/"
-                + collection_name
-                + "/"
-                + collection_name
-                + ".prim].pc_coll"
-            )
-            aloc_ioi_path, aloc_ioi_hash = get_ioi_path_and_hash(aloc_ioi_path)
-            # print("IOI Hash ALOC:", aloc_ioi_hash)
-            # print("IOI Path ALOC:", aloc_ioi_path)
-            hash_list_entry_key = aloc_ioi_hash + ".ALOC"
-            if hash_list_entry_key not in hash_list_entries:
-                hash_list_entries[hash_list_entry_key] = aloc_ioi_path
-
-        if export_scene:
-            prim_export_path = (
-                export_dir + os.sep.encode() + prim_ioi_hash.encode() + b".prim"
-            )
-        else:
-            prim_export_path = os.fsencode(filepath)
+                mesh_obs = [o for o in collection.all_objects if o.type == "MESH"]
 
-        if os.path.exists(prim_export_path):
-            os.remove(prim_export_path)
-        bre = io_binary.BinaryReader(open(prim_export_path, "wb"))
-        prim.write(bre)
-        bre.close()
-
-        if export_scene:
-            write_prim_meta(prim_export_path + b".meta.json", materials)
+                fingerprint = get_collection_fingerprint(
+                    collection, mesh_obs, meshes, export_options
+                )
+                record_path = prim_export_path + b".export.json"
+                record = read_export_record(record_path)
+                if not force_export and is_export_unchanged(record, fingerprint):
+                    for key, value in record["hash_list_entries"].items():
+                        if key not in hash_list_entries:
+                            hash_list_entries[key] = value
+                    print("[%s] unchanged since the last export, skipped" % collection.name)
+                    timing.count(report, skipped_collections=1)
+                    finished_entries = len(hash_list_entries)
+                    finished_export_dir = export_dir
+                    meshes.clear()
+                    yield collection.name
+                    continue
+                new_entries_start = len(hash_list_entries)
+                written_files = [prim_export_path]
 
-            write_aloc = False
-            # Only export to ALOC if data and collision types are both not set to NONE
-            physics_data_type = int(
-                collection.prim_collection_properties.physics_data_type
-            )
-            physics_collision_type = int(
-                collection.prim_collection_properties.physics_collision_type
-            )
-            if physics_data_type > 0 and physics_collision_type > 0:
-                # print(physics_data_type, physics_collision_type)
-                aloc = aloc_format.Physics()
-                collision_settings = aloc_format.PhysicsCollisionSettings()
-                collision_settings.data_type = physics_data_type
-                collision_settings.collider_type = physics_collision_type
-                aloc.set_collision_settings(collision_settings)
                 for ob in mesh_obs:
-                    if ob.name.startswith("ConvexMeshCollider"):
-                        vertices, indices = get_vertices_and_indices(ob)
-                        aloc.add_convex_mesh(
-                            vertices,
-                            indices,
-                            int(ob.data.prim_physics_properties.collision_layer_type),
-                        )
-                        write_aloc = True
-                        del vertices
-                        del indices
-                    elif ob.name.startswith("TriangleMeshCollider"):
-                        vertices, indices = get_vertices_and_indices(ob)
-                        aloc.add_triangle_mesh(
-                            vertices,
-                            indices,
-                            int(ob.data.prim_physics_properties.collision_layer_type),
-                        )
-                        write_aloc = True
-                        del vertices
-                        del indices
-                    elif ob.name.startswith("BoxCollider"):
-                        aloc.add_primitive_box(
-                            list(ob.dimensions / 2),
-                            int(ob.data.prim_physics_properties.collision_layer_type),
-                            list(ob.matrix_world.to_translation())[:3],
-                            list(ob.matrix_world.to_quaternion()),
-                        )
-                        write_aloc = True
-                    elif ob.name.startswith("CapsuleCollider"):
-                        radius = (ob.dimensions[0] + ob.dimensions[1]) / 4
-                        length = ob.dimensions[2]
-                        aloc.add_primitive_capsule(
-                            radius,
-                            length,
-                            int(ob.data.prim_physics_properties.collision_layer_type),
-                            list(ob.matrix_world.to_translation())[:3],
-                            list(ob.matrix_world.to_quaternion()),
+                    if (
+                        not ob.name.startswith("BoxCollider")
+                        and not ob.name.startswith("CapsuleCollider")
+                        and not ob.name.startswith("SphereCollider")
+                        and not ob.name.startswith("ConvexMeshCollider")
+                        and not ob.name.startswith("TriangleMeshCollider")
+                    ):
+                        lod_levels = get_lod_levels(
+                            bitArrToInt(ob.data.prim_properties.lod),
+                            lod_ratios if generate_lods else [],
                         )
-                        write_aloc = True
-                    elif ob.name.startswith("SphereCollider"):
-                        radius = (ob.dimensions[0] + ob.dimensions[1]) / 4
-                        aloc.add_primitive_sphere(
-                            radius,
-                            int(ob.data.prim_physics_properties.collision_layer_type),
-                            list(ob.matrix_world.to_translation())[:3],
-                            list(ob.matrix_world.to_quaternion()),
+                        for lod_ratio, lodmask in lod_levels:
+                            prim_obj = format.PrimMesh()
+
+                            material_id = ob.data.prim_properties.material_id
+                            prim_obj.prim_object.material_id = material_id
+
+                            if ob.data.prim_properties.axis_lock[0]:
+                                prim_obj.prim_object.properties.setXaxisLocked()
+
+                            if ob.data.prim_properties.axis_lock[1]:
+                                prim_obj.prim_object.properties.setYaxisLocked()
+
+                            if ob.data.prim_properties.axis_lock[2]:
+                                prim_obj.prim_object.properties.setZaxisLocked()
+
+                            if ob.data.prim_properties.no_physics:
+                                prim_obj.prim_object.properties.setNoPhysics()
+
+                            prim_obj.prim_object.lodmask = lodmask
+
+                            decimate = None
+                            if lod_ratio is not None:
+                                decimate = add_lod_decimate(ob, lod_ratio)
+                                meshes.update()
+
+                            # the LOD modifier and vertex group must never stay on the object of the user
+                            try:
+                                prim_obj.sub_mesh, material_id = save_prim_sub_mesh(
+                                    collection_name,
+                                    ob,
+                                    hitbox_slider[0],
+                                    export_dir,
+                                    material_id,
+                                    export_materials_textures,
+                                    materials,
+                                    material_jsons,
+                                    hash_list_entries,
+                                    export_scene,
+                                    hitbox_ordering,
+                                    optimize_vertex_cache,
+                                    force_highres_flag,
+                                    meshes,
+                                    lod_ratio,
+                                    textures,
+                                    written_files,
+                                    report,
+                                )
+                            finally:
+                                if decimate is not None:
+                                    remove_lod_decimate(ob, decimate)
+                                    meshes.update()
+
+                            if material_id != -1:
+                                prim_obj.prim_object.material_id = material_id
+
+                            if prim_obj.sub_mesh is None:
+                                return {"CANCELLED"}
+                            # Set subMesh properties
+                            if len(prim_obj.sub_mesh.vertexBuffer.vertices) > 100000:
+                                prim_obj.prim_object.properties.setHighResolution()
+
+                            if force_highres_flag:
+                                prim_obj.prim_object.properties.setHighResolution()
+
+                            count_prim_object(
+                                report, ob, prim_obj, meshes.get(ob, lod_ratio), lod_ratio
+                            )
+
+                            if ob.data.prim_properties.use_mesh_color:
+                                prim_obj.sub_mesh.prim_object.properties.setColor1()
+
+                            prim_obj.sub_mesh.prim_object.variant_id = (
+                                ob.data.prim_properties.variant_id
+                            )
+                            prim_obj.prim_object.zbias = ob.data.prim_properties.z_bias
+                            prim_obj.prim_object.zoffset = ob.data.prim_properties.z_offset
+                            if ob.data.prim_properties.use_mesh_color:
+                                prim_obj.sub_mesh.prim_object.color1[0] = round(
+                                    ob.data.prim_properties.mesh_color[0] * 255
+                                )
+                                prim_obj.sub_mesh.prim_object.color1[1] = round(
+                                    ob.data.prim_properties.mesh_color[1] * 255
+                                )
+                                prim_obj.sub_mesh.prim_object.color1[2] = round(
+                                    ob.data.prim_properties.mesh_color[2] * 255
+                                )
+                                prim_obj.sub_mesh.prim_object.color1[3] = round(
+                                    ob.data.prim_properties.mesh_color[3] * 255
+                                )
+
+                            prim.header.object_table.append(prim_obj)
+
+                write_aloc = False
+                aloc = None
+                if export_scene:
+                    written_files.append(prim_export_path + b".meta.json")
+                    # Only export to ALOC if data and collision types are both not set to NONE
+                    physics_data_type = int(
+                        collection.prim_collection_properties.physics_data_type
+                    )
+                    physics_collision_type = int(
+                        collection.prim_collection_properties.physics_collision_type
+                    )
+                    if physics_data_type > 0 and physics_collision_type > 0:
+                        # print(physics_data_type, physics_collision_type)
+                        aloc = alocgen.AlocJob()
+                        collision_settings = aloc_format.PhysicsCollisionSettings()
+                        collision_settings.data_type = physics_data_type
+                        collision_settings.collider_type = physics_collision_type
+                        aloc.set_collision_settings(collision_settings)
+                        for ob in mesh_obs:
+                            if ob.name.startswith("ConvexMeshCollider"):
+                                vertices, indices = get_vertices_and_indices(
+                                    meshes.get(ob, attributes=False)
+                                )
+                                aloc.add_convex_mesh(
+                                    vertices,
+                                    indices,
+                                    int(ob.data.prim_physics_properties.collision_layer_type),
+                                )
+                                write_aloc = True
+                                del vertices
+                                del indices
+                            elif ob.name.startswith("TriangleMeshCollider"):
+                                vertices, indices = get_vertices_and_indices(
+                                    meshes.get(ob, attributes=False)
+                                )
+                                aloc.add_triangle_mesh(
+                                    vertices,
+                                    indices,
+                                    int(ob.data.prim_physics_properties.collision_layer_type),
+                                )
+                                write_aloc = True
+                                del vertices
+                                del indices
+                            elif ob.name.startswith("BoxCollider"):
+                                aloc.add_primitive_box(
+                                    list(ob.dimensions / 2),
+                                    int(ob.data.prim_physics_properties.collision_layer_type),
+                                    list(ob.matrix_world.to_translation())[:3],
+                                    list(ob.matrix_world.to_quaternion()),
+                                )
+                                write_aloc = True
+                            elif ob.name.startswith("CapsuleCollider"):
+                                radius = (ob.dimensions[0] + ob.dimensions[1]) / 4
+                                length = ob.dimensions[2]
+                                aloc.add_primitive_capsule(
+                                    radius,
+                                    length,
+                                    int(ob.data.prim_physics_properties.collision_layer_type),
+                                    list(ob.matrix_world.to_translation())[:3],
+                                    list(ob.matrix_world.to_quaternion()),
+                                )
+                                write_aloc = True
+                            elif ob.name.startswith("SphereCollider"):
+                                radius = (ob.dimensions[0] + ob.dimensions[1]) / 4
+                                aloc.add_primitive_sphere(
+                                    radius,
+                                    int(ob.data.prim_physics_properties.collision_layer_type),
+                                    list(ob.matrix_world.to_translation())[:3],
+                                    list(ob.matrix_world.to_quaternion()),
+                                )
+                                write_aloc = True
+
+                    if not write_aloc:
+                        aloc_ioi_path = ""
+
+                    if export_geomentity:
+                        geom_export_path = (
+                            export_dir
+                            + os.sep.encode()
+                            + geom_ioi_hash.encode()
+                            + b".entity.json"
                         )
-                        write_aloc = True
+                        written_files.append(geom_export_path)
+                        with timing.stage(report, "json"):
+                            write_geomentity(
+                                collection,
+                                geom_export_path,
+                                geom_ioi_hash,
+                                prim_ioi_path,
+                                aloc_ioi_path,
+                            )
+
+                aloc_export_path = None
                 if write_aloc:
-                    aloc.write(
+                    aloc_export_path = (
                         export_dir + os.sep.encode() + aloc_ioi_hash.encode() + b".aloc"
                     )
-
-            if not write_aloc:
-                aloc_ioi_path = ""
-
-            if export_geomentity:
-                geom_export_path = (
-                    export_dir
-                    + os.sep.encode()
-                    + geom_ioi_hash.encode()
-                    + b".entity.json"
-                )
-                write_geomentity(
-                    collection,
-                    geom_export_path,
-                    geom_ioi_hash,
-                    prim_ioi_path,
-                    aloc_ioi_path,
+                    written_files.append(aloc_export_path)
+
+                record = {
+                    "fingerprint": fingerprint,
+                    "collection": collection.name,
+                    "files": sorted(set(os.fsdecode(path) for path in written_files)),
+                    "hash_list_entries": dict(
+                        list(hash_list_entries.items())[new_entries_start:]
+                    ),
+                }
+
+                # the files only need the extracted data, they are written while the next collection is extracted
+                writes.append(
+                    pool.submit(
+                        write_collection_files,
+                        prim,
+                        prim_export_path,
+                        materials if export_scene else None,
+                        aloc if write_aloc else None,
+                        aloc_export_path,
+                        record_path,
+                        report,
+                        timing_item,
+                    )
                 )
-
-    if len(hash_list_entries) > 0:
-        hash_list_path = export_dir + os.sep.encode() + b"hashlist.txt"
-        output = ""
-        for entry in hash_list_entries:
-            output += entry + "," + hash_list_entries[entry] + "\n"
-        with open(hash_list_path, "w", encoding="utf-8") as f:
-            f.write(output)
+                records.append((record_path, record))
+                finished_entries = len(hash_list_entries)
+                finished_export_dir = export_dir
+
+                meshes.clear()
+                yield collection.name
+
+            for write in writes:
+                write.result()
+    finally:
+        # also runs when the export is cancelled or fails, the files of the collections exported so far
+        # must not be left referencing textures and hashlist entries that were never written
+        timing.begin(report, "textures")
+        with timing.stage(report, "textures"):
+            textures.finish()
+
+        if finished_entries > 0:
+            hash_list = hashlist.HashList(finished_export_dir)
+            hash_list.update(dict(list(hash_list_entries.items())[:finished_entries]))
+            hash_list.write()
+
+    with timing.stage(report, "json"):
+        for record_path, record in records:
+            write_export_record(record_path, record)
 
     return {"FINISHED"}
 
@@ -309,29 +453,42 @@ def save_prim_sub_mesh(
     material_jsons,
     hash_list_entries,
     export_scene,
+    hitbox_ordering="NONE",
+    optimize_vertex_cache=False,
+    force_highres=False,
+    meshes=None,
+    lod_ratio=None,
+    textures=None,
+    output_files=None,
+    report=None,
 ):
     """
     Export a blender mesh to a PrimSubMesh
-    Returns a PrimSubMesh
+    The evaluated mesh is taken from meshes, a MeshCache shared by the whole export
+    Textures are queued on textures, a TextureExport that is finished at the end of the export
+    The paths of the material and texture files it writes are added to output_files
+    Timings are added to report, a timing.TimingReport, when given
+    Returns a PrimSubMesh, or None when the mesh cannot be exported, and the material id
     """
-    if len(blender_obj.modifiers) == 0:
-        mesh = blender_obj.to_mesh()
-    else:
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        mesh_owner = blender_obj.evaluated_get(depsgraph)
-        mesh = mesh_owner.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+    finish_textures = textures is None
+    if finish_textures:
+        textures = bl_export_textures.TextureExport(report=report)
     prim_mesh = format.PrimSubMesh()
 
-    if blender_obj.data.uv_layers:
-        uvmap = blender_obj.data.uv_layers.active.name
-        mesh.calc_tangents(uvmap=uvmap)
-    else:
+    if not blender_obj.data.uv_layers:
         BlenderUI.MessageBox(
-            '"%s" is missing a UV map' % mesh.name, "Exporting error", "ERROR"
+            '"%s" is missing a UV map' % blender_obj.data.name,
+            "Exporting error",
+            "ERROR",
         )
-        return None
+        return None, material_id
 
-    locs = get_positions(mesh, blender_obj.matrix_world.copy())
+    if meshes is None:
+        meshes = mesh_cache.MeshCache(report)
+    evaluated = meshes.get(blender_obj, lod_ratio)
+    extraction_start = time.perf_counter()
+    locs = evaluated.locs
+    num_uv_layers = len(evaluated.uvs)
 
     dot_fields = [("vertex_index", np.uint32)]
     dot_fields += [("nx", np.float32), ("ny", np.float32), ("nz", np.float32)]
@@ -347,7 +504,7 @@ def save_prim_sub_mesh(
         ("bz", np.float32),
         ("bw", np.float32),
     ]
-    for uv_i in range(len(mesh.uv_layers)):
+    for uv_i in range(num_uv_layers):
         dot_fields += [("uv%dx" % uv_i, np.float32), ("uv%dy" % uv_i, np.float32)]
     dot_fields += [
         ("colorR", np.float32),
@@ -356,63 +513,57 @@ def save_prim_sub_mesh(
         ("colorA", np.float32),
     ]
 
-    dots = np.empty(len(mesh.loops), dtype=np.dtype(dot_fields))
+    dots = np.empty(evaluated.num_loops, dtype=np.dtype(dot_fields))
 
-    vidxs = np.empty(len(mesh.loops))
-    mesh.loops.foreach_get("vertex_index", vidxs)
-    dots["vertex_index"] = vidxs
-    del vidxs
+    dots["vertex_index"] = evaluated.vertex_indices
 
-    normals = get_normals(mesh)
+    normals = evaluated.normals
     dots["nx"] = normals[:, 0]
     dots["ny"] = normals[:, 1]
     dots["nz"] = normals[:, 2]
-    del normals
 
-    tangents = get_tangents(mesh)
+    tangents = evaluated.tangents
     dots["tx"] = tangents[:, 0]
     dots["ty"] = tangents[:, 1]
     dots["tz"] = tangents[:, 2]
     dots["tw"] = tangents[:, 3]
-    del tangents
 
-    bitangents = get_bitangents(mesh)
+    bitangents = evaluated.bitangents
     dots["bx"] = bitangents[:, 0]
     dots["by"] = bitangents[:, 1]
     dots["bz"] = bitangents[:, 2]
     dots["bw"] = bitangents[:, 3]
-    del bitangents
 
-    for uv_i in range(len(mesh.uv_layers)):
-        uvs = get_uvs(mesh, uv_i)
+    for uv_i, uvs in enumerate(evaluated.uvs):
         dots["uv%dx" % uv_i] = uvs[:, 0]
         dots["uv%dy" % uv_i] = uvs[:, 1]
-        del uvs
 
-    if len(mesh.vertex_colors) > 0:
-        colors = get_colors(mesh, 0)
+    if evaluated.colors is not None:
+        colors = evaluated.colors
         dots["colorR"] = colors[:, 0]
         dots["colorG"] = colors[:, 1]
         dots["colorB"] = colors[:, 2]
         dots["colorA"] = colors[:, 3]
-        del colors
     else:
         # TODO: look into converting this to color1
-        colors = np.full(len(mesh.loops) * 4, 0xFF, dtype=np.float32)
-        colors = colors.reshape(len(mesh.loops), 4)
+        colors = np.full(evaluated.num_loops * 4, 0xFF, dtype=np.float32)
+        colors = colors.reshape(evaluated.num_loops, 4)
         dots["colorR"] = colors[:, 0]
         dots["colorG"] = colors[:, 1]
         dots["colorB"] = colors[:, 2]
         dots["colorA"] = colors[:, 3]
 
-    # Calculate triangles and sort them into primitives.
-    mesh.calc_loop_triangles()
-    loop_indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
-    mesh.loop_triangles.foreach_get("loops", loop_indices)
+    # Sort the triangles into primitives.
+    loop_indices = evaluated.loop_triangles
 
     prim_dots = dots[loop_indices]
-    prim_dots, prim_mesh.indices = np.unique(prim_dots, return_inverse=True)
-    prim_mesh.indices = prim_mesh.indices.tolist()
+    timing.add_time(report, "extraction", time.perf_counter() - extraction_start)
+    with timing.stage(report, "welding"):
+        vertex_corners, indices = weld_prim_corners(
+            prim_dots, locs, num_uv_layers, force_highres
+        )
+    extraction_start = time.perf_counter()
+    prim_dots = prim_dots[vertex_corners]
     prim_mesh.vertexBuffer.vertices = [0] * len(prim_dots)
 
     blender_idxs = prim_dots["vertex_index"]
@@ -441,8 +592,8 @@ def save_prim_sub_mesh(
     bitangents[:, 2] = prim_dots["bz"]
     bitangents[:, 3] = 1 / 255
 
-    uvs = np.empty((len(mesh.uv_layers), len(prim_dots), 2), dtype=np.float32)
-    for tex_coord_i in range(len(mesh.uv_layers)):
+    uvs = np.empty((num_uv_layers, len(prim_dots), 2), dtype=np.float32)
+    for tex_coord_i in range(num_uv_layers):
         uvs[tex_coord_i, :, 0] = prim_dots["uv%dx" % tex_coord_i]
         uvs[tex_coord_i, :, 1] = prim_dots["uv%dy" % tex_coord_i]
 
@@ -452,19 +603,52 @@ def save_prim_sub_mesh(
     colors[:, 2] = prim_dots["colorB"]
     colors[:, 3] = prim_dots["colorA"]
 
+    timing.add_time(report, "extraction", time.perf_counter() - extraction_start)
+    ordering_start = time.perf_counter()
+    if hitbox_ordering != "NONE":
+        indices = order_prim_triangles(
+            blender_obj.name,
+            positions,
+            indices,
+            max_tris_per_chunk,
+            hitbox_ordering,
+            report,
+        )
+
+    if optimize_vertex_cache:
+        # keep the triangles inside their chunk when the chunks were ordered for the hitboxes
+        indices, vertex_order = optimize_prim_vertex_cache(
+            blender_obj.name,
+            positions,
+            indices,
+            max_tris_per_chunk if hitbox_ordering != "NONE" else None,
+        )
+        positions = positions[vertex_order]
+        normals = normals[vertex_order]
+        tangents = tangents[vertex_order]
+        bitangents = bitangents[vertex_order]
+        uvs = uvs[:, vertex_order]
+        colors = colors[vertex_order]
+    timing.add_time(report, "ordering", time.perf_counter() - ordering_start)
+
+    extraction_start = time.perf_counter()
     for i, vertex in enumerate(prim_mesh.vertexBuffer.vertices):
         vertex = format.Vertex()
         vertex.position = positions[i]
         vertex.normal = normals[i]
         vertex.tangent = tangents[i]
         vertex.bitangent = bitangents[i]
-        for tex_coord_i in range(len(mesh.uv_layers)):
+        for tex_coord_i in range(num_uv_layers):
             vertex.uv[tex_coord_i] = uvs[tex_coord_i, i]
         vertex.color = (colors[i] * 255).astype("uint8").tolist()
         prim_mesh.vertexBuffer.vertices[i] = vertex
 
+    prim_mesh.indices = indices.tolist()
+    timing.add_time(report, "extraction", time.perf_counter() - extraction_start)
+
     prim_mesh.collision.tri_per_chunk = max_tris_per_chunk
-    save_prim_hitboxes(mesh, prim_mesh)
+    with timing.stage(report, "hitboxes"):
+        save_prim_hitboxes(positions[indices, :3], prim_mesh)
 
     if export_scene:
         if export_materials_textures:
@@ -573,17 +757,16 @@ def save_prim_sub_mesh(
                                                         + os.sep.encode()
                                                         + texture_filename.encode()
                                                     )
-                                                    image_texture.save_render(
-                                                        texture_output_path
-                                                    )
-                                                    text_texd_scale = int(
-                                                        image_texture.size[0]
-                                                    ) * int(image_texture.size[1])
-                                                    write_texture_meta(
-                                                        texture_output_path + b".meta",
-                                                        text_texd_scale,
+                                                    textures.add(
+                                                        image_texture,
+                                                        texture_output_path,
                                                         b"\x49",
                                                     )
+                                                    if output_files is not None:
+                                                        output_files += [
+                                                            texture_output_path,
+                                                            texture_output_path + b".meta",
+                                                        ]
                                     if "Normal" in n.inputs:
                                         for l in n.inputs["Normal"].links:
                                             if l.from_node.type == "NORMAL_MAP":
@@ -664,24 +847,16 @@ def save_prim_sub_mesh(
                                                                     + os.sep.encode()
                                                                     + texture_filename.encode()
                                                                 )
-                                                                image_texture.save_render(
-                                                                    texture_output_path
-                                                                )
-                                                                text_texd_scale = int(
-                                                                    image_texture.size[
-                                                                        0
-                                                                    ]
-                                                                ) * int(
-                                                                    image_texture.size[
-                                                                        1
-                                                                    ]
-                                                                )
-                                                                write_texture_meta(
-                                                                    texture_output_path
-                                                                    + b".meta",
-                                                                    text_texd_scale,
+                                                                textures.add(
+                                                                    image_texture,
+                                                                    texture_output_path,
                                                                     b"\x55",
                                                                 )
+                                                                if output_files is not None:
+                                                                    output_files += [
+                                                                        texture_output_path,
+                                                                        texture_output_path + b".meta",
+                                                                    ]
                                     # specular_node = None
                                     if bpy.app.version >= (4, 0, 0):
                                         specular_node = n.inputs["Specular IOR Level"]
@@ -752,17 +927,16 @@ def save_prim_sub_mesh(
                                                         + os.sep.encode()
                                                         + texture_filename.encode()
                                                     )
-                                                    image_texture.save_render(
-                                                        texture_output_path
-                                                    )
-                                                    text_texd_scale = int(
-                                                        image_texture.size[0]
-                                                    ) * int(image_texture.size[1])
-                                                    write_texture_meta(
-                                                        texture_output_path + b".meta",
-                                                        text_texd_scale,
+                                                    textures.add(
+                                                        image_texture,
+                                                        texture_output_path,
                                                         b"\x5A",
                                                     )
+                                                    if output_files is not None:
+                                                        output_files += [
+                                                            texture_output_path,
+                                                            texture_output_path + b".meta",
+                                                        ]
                                     first_material_found = True
                                     ioi_path = (
                                         "[assembly:/_pro/environment/materials/"
@@ -845,91 +1019,22 @@ def save_prim_sub_mesh(
                                         hash_list_entries[
                                             hash_list_entry_key_entityblueprint
                                         ] = ioi_path_entityblueprint
-                                    write_material_json(
-                                        material_json_output_path,
-                                        material,
-                                        material_jsons,
-                                    )
+                                    with timing.stage(report, "json"):
+                                        write_material_json(
+                                            material_json_output_path,
+                                            material,
+                                            material_jsons,
+                                        )
+                                    if output_files is not None:
+                                        output_files.append(material_json_output_path)
                                     materials[slot.material.name] = material
                                     material_id = materials[slot.material.name]["index"]
 
+    if finish_textures:
+        textures.finish()
     return prim_mesh, material_id
 
 
-def get_positions(mesh, matrix):
-    # read the vertex locations
-    locs = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
-    source = mesh.vertices
-
-    for vert in source:
-        vert.co = matrix @ vert.co
-
-    source.foreach_get("co", locs)
-    locs = locs.reshape(len(mesh.vertices), 3)
-    locs = np.c_[locs, np.ones(len(mesh.vertices), dtype=int)]
-
-    return locs
-
-
-def get_normals(mesh):
-    """Get normal for each loop."""
-    normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
-    
-    if bpy.app.version < (4, 1, 0):
-        mesh.calc_normals_split()
-    
-    mesh.loops.foreach_get("normal", normals)
-
-    normals = normals.reshape(len(mesh.loops), 3)
-
-    for ns in normals:
-        is_zero = ~ns.any()
-        ns[is_zero, 2] = 1
-
-    return normals
-
-
-def get_tangents(mesh):
-    """Get an array of the tangent for each loop."""
-    tangents = np.empty(len(mesh.loops) * 3, dtype=np.float32)
-    mesh.loops.foreach_get("tangent", tangents)
-    tangents = tangents.reshape(len(mesh.loops), 3)
-    tangents = np.c_[tangents, np.ones(len(mesh.loops), dtype=int)]
-
-    return tangents
-
-
-def get_bitangents(mesh):
-    """Get an array of the tangent for each loop."""
-    bitangents = np.empty(len(mesh.loops) * 3, dtype=np.float32)
-    mesh.loops.foreach_get("bitangent", bitangents)
-    bitangents = bitangents.reshape(len(mesh.loops), 3)
-    bitangents = np.c_[bitangents, np.ones(len(mesh.loops), dtype=int)]
-
-    return bitangents
-
-
-def get_uvs(mesh, uv_i):
-    layer = mesh.uv_layers[uv_i]
-    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
-    layer.data.foreach_get("uv", uvs)
-    uvs = uvs.reshape(len(mesh.loops), 2)
-
-    # u,v -> u,1-v
-    uvs[:, 1] *= -1
-    uvs[:, 1] += 1
-
-    return uvs
-
-
-def get_colors(mesh, color_i):
-    colors = np.empty(len(mesh.loops) * 4, dtype=np.float32)
-    layer = mesh.vertex_colors[color_i]
-    mesh.color_attributes[layer.name].data.foreach_get("color", colors)
-    colors = colors.reshape(len(mesh.loops), 4)
-    return colors
-
-
 def bitArrToInt(arr):
     lod_str = ""
     for bit in arr:
@@ -940,252 +1045,231 @@ def bitArrToInt(arr):
     return int(lod_str, 2)
 
 
-def triangulate_object(obj):
-    me = obj.data
-    bm = bmesh.new()
-    bm.from_mesh(me)
-
-    bmesh.ops.triangulate(bm, faces=bm.faces[:])
-
-    bm.to_mesh(me)
-    bm.free()
+def parse_lod_ratios(lod_ratios: str):
+    """Turns a comma separated list of triangle ratios into a list of floats, highest detail first"""
+    ratios = []
+    for ratio in lod_ratios.replace(";", ",").split(","):
+        ratio = ratio.strip()
+        if not ratio:
+            continue
+        try:
+            ratio = float(ratio)
+        except ValueError:
+            print("Ignoring invalid LOD ratio: " + ratio)
+            continue
+        if 0.0 < ratio < 1.0:
+            ratios.append(ratio)
+    return sorted(ratios, reverse=True)
+
+
+def get_lod_levels(lodmask: int, lod_ratios):
+    """
+    Distribute the LOD bits of a mesh over the mesh itself and its generated LODs.
+    Every level gets the next LOD bit set in the lodmask, the last level keeps all remaining bits.
+    Returns a list of (decimate ratio, lodmask) pairs, the ratio of the source mesh is None
+    """
+    bits = [bit for bit in range(8) if lodmask & (1 << bit)]
+    ratios = [None] + list(lod_ratios)
+    if len(bits) < 2:
+        return [(None, lodmask)]
+    ratios = ratios[: len(bits)]
+
+    levels = []
+    for level, ratio in enumerate(ratios):
+        if level == len(ratios) - 1:
+            mask = sum(1 << bit for bit in bits[level:])
+        else:
+            mask = 1 << bits[level]
+        levels.append((ratio, mask))
+    return levels
 
 
-def save_prim_hitboxes(mesh, prim_mesh):
-    bb_min = np.array([sys.float_info.max] * 3)
-    bb_max = np.array([-sys.float_info.max] * 3)
-    for f in range(len(mesh.loop_triangles)):
-        for v in range(3):
-            #print(f"Triangle loop {f}: Vertex {v}: Index {mesh.loop_triangles[f].vertices[v]}")
-            bb_min = np.min([bb_min, mesh.vertices[mesh.loop_triangles[f].vertices[v]].co], axis=0)
-            bb_max = np.max([bb_max, mesh.vertices[mesh.loop_triangles[f].vertices[v]].co], axis=0)
-    bb_diff = bb_max - bb_min
-    num_chunks = int(len(mesh.loop_triangles) / prim_mesh.collision.tri_per_chunk)
-    if len(mesh.loop_triangles) % prim_mesh.collision.tri_per_chunk:
-        num_chunks += 1
-    for n in range(num_chunks):
-        #print(f"chunk: {n}")
-        #print(f"faces: {n*prim_mesh.collision.tri_per_chunk} to {(n+1)*prim_mesh.collision.tri_per_chunk}")
-        coli_bb_min = np.array([sys.float_info.max] * 3)
-        coli_bb_max = np.array([-sys.float_info.max] * 3)
-        for f in range(n*prim_mesh.collision.tri_per_chunk,(n+1)*prim_mesh.collision.tri_per_chunk):
-            if f == len(mesh.loop_triangles):
-                break
-            for v in range(3):
-                coli_bb_min = np.min([coli_bb_min, mesh.vertices[mesh.loop_triangles[f].vertices[v]].co], axis=0)
-                coli_bb_max = np.max([coli_bb_max, mesh.vertices[mesh.loop_triangles[f].vertices[v]].co], axis=0)
-        entry = format.BoxColiEntry()
-        coli_min = (coli_bb_min - bb_min) * 255
-        coli_max = (coli_bb_max - bb_min) * 255
-        coli_min = [(coli_min[i] / bb_diff[i]) if bb_diff[i] != 0 else 0 for i in range(3)]
-        coli_max = [(coli_max[i] / bb_diff[i]) if bb_diff[i] != 0 else 0 for i in range(3)]
-        for i in range(3):
-            entry.min[i] = int(round(coli_min[i]))
-            entry.max[i] = int(round(coli_max[i]))
-        prim_mesh.collision.box_entries.append(entry)
-        #print(f"coli entry min: {entry.min}")
-        #print(f"coli entry max: {entry.max}")
+def add_lod_decimate(obj, ratio: float):
+    """
+    Adds a collapse decimate modifier to the object to generate a LOD.
+    Vertices on UV seams and vertex color borders are weighted so they are kept as long as possible
+    """
+    protected = get_lod_border_vertices(obj.data)
+    group = obj.vertex_groups.new(name="Glacier LOD Border")
+    if len(protected):
+        group.add(protected.tolist(), 1.0, "REPLACE")
+
+    decimate = obj.modifiers.new(name="Glacier LOD", type="DECIMATE")
+    decimate.decimate_type = "COLLAPSE"
+    decimate.ratio = ratio
+    decimate.use_collapse_triangulate = True
+    decimate.vertex_group = group.name
+    decimate.invert_vertex_group = True
+    decimate.vertex_group_factor = 1000.0
+    return decimate
+
+
+def remove_lod_decimate(obj, decimate):
+    group = obj.vertex_groups.get(decimate.vertex_group)
+    obj.modifiers.remove(decimate)
+    if group is not None:
+        obj.vertex_groups.remove(group)
+
+
+def get_lod_border_vertices(mesh):
+    """Returns the indices of the vertices whose loops do not share the same UVs or vertex color"""
+    num_loops = len(mesh.loops)
+    vidxs = np.empty(num_loops, dtype=np.int64)
+    mesh.loops.foreach_get("vertex_index", vidxs)
 
+    attributes = []
+    for layer in mesh.uv_layers:
+        uvs = np.empty(num_loops * 2, dtype=np.float32)
+        layer.data.foreach_get("uv", uvs)
+        attributes.append(uvs.reshape(num_loops, 2))
+    if len(mesh.vertex_colors) > 0:
+        attributes.append(mesh_cache.get_colors(mesh, 0))
 
-def compare_x_axis(a, b):
-    max_a = np.max([a[0].position[0], a[1].position[0], a[2].position[0]])
-    max_b = np.max([b[0].position[0], b[1].position[0], b[2].position[0]])
-    if max_a > max_b:
-        return 1
-    elif max_a < max_b:
-        return -1
-    else:
-        return 0
+    border = np.zeros(len(mesh.vertices), dtype=bool)
+    for values in attributes:
+        # a vertex is on a border when it has more than one distinct value over its loops
+        corners = np.unique(np.c_[vidxs, values.view(np.int32)], axis=0)
+        border |= np.bincount(corners[:, 0], minlength=len(mesh.vertices)) > 1
+    return np.flatnonzero(border)
 
 
-def compare_y_axis(a, b):
-    max_a = np.max([a[0].position[1], a[1].position[1], a[2].position[1]])
-    max_b = np.max([b[0].position[1], b[1].position[1], b[2].position[1]])
-    if max_a > max_b:
-        return 1
-    elif max_a < max_b:
-        return -1
+def get_prim_corner_keys(dots, locs, num_uv_layers, highres):
+    """
+    Packs every triangle corner into the bytes it will be written as.
+    Positions use the same scale and bias as PrimMesh.update, UVs use the bounds of the first layer
+    """
+    keys = []
+    positions = locs[dots["vertex_index"], :3]
+    if highres:
+        keys.append(positions.astype(np.float32).view(np.uint8))
     else:
-        return 0
+        pos_scale, pos_bias = optimize.scale_bias(positions)
+        keys.append(optimize.quantize_short(positions, pos_scale, pos_bias).view(np.uint8))
 
+    for prefix in ("n", "t", "b"):
+        vectors = np.c_[dots[prefix + "x"], dots[prefix + "y"], dots[prefix + "z"]]
+        keys.append(optimize.quantize_unit_byte(vectors))
 
-def compare_z_axis(a, b):
-    max_a = np.max([a[0].position[2], a[1].position[2], a[2].position[2]])
-    max_b = np.max([b[0].position[2], b[1].position[2], b[2].position[2]])
-    if max_a > max_b:
-        return 1
-    elif max_a < max_b:
-        return -1
-    else:
-        return 0
+    if num_uv_layers > 0:
+        uv_scale, uv_bias = optimize.scale_bias(np.c_[dots["uv0x"], dots["uv0y"]])
+        for uv_i in range(num_uv_layers):
+            uvs = np.c_[dots["uv%dx" % uv_i], dots["uv%dy" % uv_i]]
+            keys.append(optimize.quantize_short(uvs, uv_scale, uv_bias).view(np.uint8))
 
+    colors = np.c_[dots["colorR"], dots["colorG"], dots["colorB"], dots["colorA"]]
+    keys.append((colors * 255).astype("uint8"))
+    return np.concatenate(keys, axis=1)
 
-def get_vertices_and_indices(blender_obj):
-    if len(blender_obj.modifiers) == 0:
-        mesh = blender_obj.to_mesh()
-    else:
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        mesh_owner = blender_obj.evaluated_get(depsgraph)
-        mesh = mesh_owner.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-
-    locs = get_positions(mesh, blender_obj.matrix_world.copy())
 
-    dot_fields = [("vertex_index", np.uint32)]
+def weld_prim_corners(dots, locs, num_uv_layers, force_highres):
+    """
+    Merge the triangle corners that end up as the same vertex in the file,
+    corners that only differ by float noise below the on-disk precision become one vertex.
+    Returns the first corner of every vertex and the vertex index of every corner
+    """
+    if len(dots) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
 
-    dots = np.empty(len(mesh.loops), dtype=np.dtype(dot_fields))
+    keys = get_prim_corner_keys(dots, locs, num_uv_layers, force_highres)
+    vertex_corners, indices = optimize.weld_keys(keys)
+    if len(vertex_corners) > 100000 and not force_highres:
+        # the positions will be written as floats, weld on those instead
+        keys = get_prim_corner_keys(dots, locs, num_uv_layers, True)
+        vertex_corners, indices = optimize.weld_keys(keys)
+    return vertex_corners, indices
 
-    vidxs = np.empty(len(mesh.loops))
-    mesh.loops.foreach_get("vertex_index", vidxs)
-    dots["vertex_index"] = vidxs
-    del vidxs
 
-    # Calculate triangles and sort them into primitives.
-    mesh.calc_loop_triangles()
-    loop_indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
-    mesh.loop_triangles.foreach_get("loops", loop_indices)
+def order_prim_triangles(name, positions, indices, tri_per_chunk, method, report=None):
+    """
+    Reorder the triangles of an index buffer so the BoxColi chunks get as tight as possible.
+    The chunk volumes before and after are only measured and printed when a timing report is given.
+    Returns the reordered index buffer
+    """
+    triangles = indices.reshape(-1, 3)
+    tri_order = optimize.spatial_triangle_order(
+        positions[indices, :3], tri_per_chunk, method
+    )
+    ordered = triangles[tri_order].reshape(-1)
+    if report is None:
+        return ordered
+
+    volume_before, overlap_before = optimize.chunk_volume_report(
+        positions[indices, :3], tri_per_chunk
+    )
+    volume_after, overlap_after = optimize.chunk_volume_report(
+        positions[ordered, :3], tri_per_chunk
+    )
+    print(
+        "[%s] %s BoxColi chunks: volume %.4f -> %.4f, overlap %.4f -> %.4f"
+        % (name, method, volume_before, volume_after, overlap_before, overlap_after)
+    )
+    return ordered
+
+
+def optimize_prim_vertex_cache(name, positions, indices, tri_per_chunk):
+    """
+    Reorder the triangles for the post-transform vertex cache and the vertices for fetch locality.
+    Returns the new index buffer and the new order of the vertices
+    """
+    acmr_before, atvr_before = optimize.vertex_cache_report(indices)
+    indices, vertex_order = optimize.optimize_vertex_cache(
+        indices, positions, tri_per_chunk
+    )
+    acmr_after, atvr_after = optimize.vertex_cache_report(indices)
+    print(
+        "[%s] vertex cache: ACMR %.3f -> %.3f, ATVR %.3f -> %.3f"
+        % (name, acmr_before, acmr_after, atvr_before, atvr_after)
+    )
+    return indices, vertex_order
+
+
+def save_prim_hitboxes(tri_positions, prim_mesh):
+    """
+    Generate the BoxColi chunks of a PrimSubMesh.
+    tri_positions holds the three corner positions of every triangle, in index buffer order
+    """
+    if len(tri_positions) == 0:
+        return
 
-    prim_dots = dots[loop_indices]
-    prim_dots, indices = np.unique(prim_dots, return_inverse=True)
-    indices = indices.tolist()
+    tri_positions = np.asarray(tri_positions, dtype=np.float64)
+    bb_min = tri_positions.min(axis=0)
+    bb_max = tri_positions.max(axis=0)
+    bb_diff = bb_max - bb_min
 
-    blender_idxs = prim_dots["vertex_index"]
-    vertices = np.empty((len(prim_dots), 3), dtype=np.float32)
-    vertices[:, 0] = locs[blender_idxs, 0]
-    vertices[:, 1] = locs[blender_idxs, 1]
-    vertices[:, 2] = locs[blender_idxs, 2]
-    vertices = vertices.tolist()
-    vertices = [i for v in vertices for i in v]
-
-    return vertices, indices
-
-
-def write_texture_meta(output_path, texture_size, format):
-    meta_data = b"\x00\x00\x00\x00\x48\x00\x00\x00"
-    meta_data += format
-    meta_data += b"\x00\x01"
-    scaling = b"\x00\x00\x00\x00\x00"
-    if texture_size == 32768 or texture_size == 65536:
-        scaling = b"\x01\x01\x00\x00\x00"
-    elif texture_size == 131072 or texture_size == 262144:
-        scaling = b"\x02\x02\x00\x00\x00"
-    elif texture_size == 524288 or texture_size == 1048576:
-        scaling = b"\x03\x03\x00\x00\x00"
-    elif texture_size == 2097152 or texture_size == 4194304:
-        scaling = b"\x04\x04\x00\x00\x00"
-    elif texture_size == 8388608 or texture_size == 16777216:
-        scaling = b"\x05\x05\x00\x00\x00"
-    meta_data += scaling
-    with open(output_path, "wb") as f:
-        f.write(meta_data)
+    coli_bb_min, coli_bb_max = optimize.chunk_bounds(
+        tri_positions, prim_mesh.collision.tri_per_chunk
+    )
+
+    # quantize the chunk bounds to a byte relative to the bounding box of the mesh
+    coli_min = np.divide(
+        (coli_bb_min - bb_min) * 255,
+        bb_diff,
+        out=np.zeros_like(coli_bb_min),
+        where=bb_diff != 0,
+    )
+    coli_max = np.divide(
+        (coli_bb_max - bb_min) * 255,
+        bb_diff,
+        out=np.zeros_like(coli_bb_max),
+        where=bb_diff != 0,
+    )
+    coli_min = np.rint(coli_min).astype(np.uint8).tolist()
+    coli_max = np.rint(coli_max).astype(np.uint8).tolist()
+
+    for chunk_min, chunk_max in zip(coli_min, coli_max):
+        entry = format.BoxColiEntry()
+        entry.min = chunk_min
+        entry.max = chunk_max
+        prim_mesh.collision.box_entries.append(entry)
 
 
 def write_material_json(output_path, material, material_jsons):
-    material_jsons_copy = copy.deepcopy(material_jsons)
-    for t in material_jsons_copy.materials[material["material"]]["Material"][
-        "Instance"
-    ][0]["Binder"][0]["Texture"]:
-        if "FriendlyName" in t:
-            del t["FriendlyName"]
-    for f in material_jsons_copy.materials[material["material"]]["Material"][
-        "Instance"
-    ][0]["Binder"][0]["Float Value"]:
-        if "FriendlyName" in f:
-            del f["FriendlyName"]
-    for c in material_jsons_copy.materials[material["material"]]["Material"][
-        "Instance"
-    ][0]["Binder"][0]["Color"]:
-        if "FriendlyName" in c:
-            del c["FriendlyName"]
-    # print("Writing material json for " + material["name"])
-    for m in material_jsons_copy.materials:
-        if m == material["material"]:
-            material_json = material_jsons_copy.materials[m]
-            material_json["MATI"] = material["ioi_path"]
-            material_json["MATT"] = material["ioi_path_entitytype"]
-            material_json["MATB"] = material["ioi_path_entityblueprint"]
-            material_json["ERES"] = material["ERES"]
-            material_json["Material"]["Instance"][0]["Name"] = material["name"]
-            if "Texture" in material_json["Material"]["Instance"][0]["Binder"][0]:
-                for t in material_json["Material"]["Instance"][0]["Binder"][0][
-                    "Texture"
-                ]:
-                    if t["Texture Id"] == "diffuse":
-                        if "diffuse" in material:
-                            t["Texture Id"] = material["diffuse"]
-                            print("Diffuse: " + material["diffuse"])
-                        else:
-                            t["Texture Id"] = ""
-                    if t["Texture Id"] == "normal":
-                        if "normal" in material:
-                            t["Texture Id"] = material["normal"]
-                        else:
-                            t["Texture Id"] = ""
-                    if t["Texture Id"] == "specular":
-                        if "specular" in material:
-                            t["Texture Id"] = material["specular"]
-                        else:
-                            t["Texture Id"] = ""
-            for f in material["floats"]:
-                if (
-                    "Float Value"
-                    in material_json["Material"]["Instance"][0]["Binder"][0]
-                ):
-                    for fv in material_json["Material"]["Instance"][0]["Binder"][0][
-                        "Float Value"
-                    ]:
-                        if f.name == fv["Name"]:
-                            fv["Value"] = f.value
-            for c in material["colors"]:
-                if "Color" in material_json["Material"]["Instance"][0]["Binder"][0]:
-                    for cv in material_json["Material"]["Instance"][0]["Binder"][0][
-                        "Color"
-                    ]:
-                        if c.name == cv["Name"]:
-                            cv["Value"] = [c.value.r, c.value.g, c.value.b]
-
-            # Flags section
-            for flag in material["class_flags"]:
-                material_json["Flags"]["Class"][flag["name"]] = (
-                    True if flag["value"] == 1 else False
-                )
-
-            for flag in material["instance_flags"]:
-                material_json["Flags"]["Instance"][flag["name"]] = (
-                    True if flag["value"] == 1 else False
-                )
-
-            # Overrides section
-            for texture_key, texture_id in material_json["Overrides"][
-                "Texture"
-            ].items():
-                if texture_id in ["diffuse", "specular", "normal"]:
-                    if texture_id in material:
-                        material_json["Overrides"]["Texture"][texture_key] = material[
-                            texture_id
-                        ]
-                    else:
-                        material_json["Overrides"]["Texture"][texture_key] = ""
-            for float_key in material_json["Overrides"]:
-                if float_key in material["floats"]:
-                    material_json["Overrides"][float_key] = material["floats"][
-                        float_key
-                    ].value
-            for color_key, color_values in material_json["Overrides"]["Color"].items():
-                if color_key in material["colors"]:
-                    material_json["Overrides"]["Color"][color_key] = [
-                        material["colors"][color_key].value.r,
-                        material["colors"][color_key].value.g,
-                        material["colors"][color_key].value.b,
-                    ]
-
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(material_json, f, ensure_ascii=False, indent=4)
-
-
-def get_ioi_path_and_hash(ioi_path):
-    ioi_path = ioi_path.lower()
-    ioi_hash = "00" + hashlib.md5(ioi_path.encode("utf-8")).hexdigest().upper()[2:16]
-    return ioi_path, ioi_hash
+    template = material_jsons.get_template(material["material"])
+    if template is None:
+        return
+    material_json = template.fill(material)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(material_json, f, ensure_ascii=False, indent=4)
 
 
 def write_geomentity(
@@ -1356,6 +1440,231 @@ def write_geomentity(
         json.dump(geomentity_json, f, ensure_ascii=False, indent=4)
 
 
+def write_collection_files(
+    prim,
+    prim_export_path,
+    materials=None,
+    aloc=None,
+    aloc_export_path=None,
+    record_path=None,
+    report=None,
+    timing_item=None,
+):
+    """
+    Encode and write the files of one exported collection.
+    Does not touch any Blender data, so it can run on a worker thread.
+    The export record of the collection is removed first, the exporter writes it again after the textures
+    """
+    if record_path is not None and os.path.exists(record_path):
+        os.remove(record_path)
+    if os.path.exists(prim_export_path):
+        os.remove(prim_export_path)
+    with timing.stage(report, "encoding", timing_item):
+        primgen.write_prim_in_subprocess(prim, prim_export_path)
+    count_prim_bytes(report, prim, os.path.getsize(prim_export_path), timing_item)
+
+    if materials is not None:
+        with timing.stage(report, "json", timing_item):
+            write_prim_meta(prim_export_path + b".meta.json", materials)
+
+    if aloc is not None:
+        with timing.stage(report, "aloc", timing_item):
+            aloc.cook_in_subprocess(aloc_export_path)
+
+
+def count_prim_object(report, blender_obj, prim_obj, evaluated, lod_ratio):
+    """Adds the loop, vertex, triangle and chunk counts of an exported PrimMesh to the timing report"""
+    sub_mesh = prim_obj.sub_mesh
+    loops = evaluated.num_loops
+    vertices = len(sub_mesh.vertexBuffer.vertices)
+    triangles = len(sub_mesh.indices) // 3
+    chunks = len(sub_mesh.collision.box_entries)
+    highres = prim_obj.prim_object.properties.isHighResolution()
+    timing.add_object(
+        report,
+        blender_obj.name,
+        lod_ratio=lod_ratio,
+        loops=loops,
+        vertices=vertices,
+        weld_ratio=vertices / loops if loops > 0 else 0,
+        triangles=triangles,
+        chunks=chunks,
+        highres=highres,
+    )
+    timing.count(
+        report,
+        objects=1,
+        loops=loops,
+        vertices=vertices,
+        triangles=triangles,
+        chunks=chunks,
+        highres_objects=int(highres),
+    )
+
+
+def count_prim_bytes(report, prim, file_size, timing_item=None):
+    """Adds the bytes written per section of a PRIM file to the timing report, headers are everything else"""
+    sections = {"indices": 0, "vertices": 0, "boxcoli": 0, "cloth": 0}
+    for prim_obj in prim.header.object_table:
+        if prim_obj is None:
+            continue
+        for name, size in prim_obj.sub_mesh.section_sizes.items():
+            sections[name] += size
+    timing.count(
+        report,
+        timing_item,
+        bytes=file_size,
+        index_bytes=sections["indices"],
+        vertex_bytes=sections["vertices"],
+        boxcoli_bytes=sections["boxcoli"],
+        cloth_bytes=sections["cloth"],
+        header_bytes=file_size - sum(sections.values()),
+    )
+
+
+EXPORT_RECORD_VERSION = 1
+
+COLLIDER_PREFIXES = (
+    "BoxCollider",
+    "CapsuleCollider",
+    "SphereCollider",
+    "ConvexMeshCollider",
+    "TriangleMeshCollider",
+)
+
+
+def hash_property_group(h, group):
+    """Adds the values of every property of a PropertyGroup to the hash"""
+    for prop in group.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(group, prop.identifier)
+        if prop.type == "COLLECTION":
+            for item in value:
+                hash_property_group(h, item)
+            continue
+        if prop.type == "POINTER":
+            value = getattr(value, "name", None)
+        elif isinstance(value, set):
+            value = sorted(value)
+        elif getattr(prop, "is_array", False):
+            value = value[:]
+        h.update(("%s=%r;" % (prop.identifier, value)).encode())
+
+
+def hash_material(h, material):
+    """
+    Adds the PRIM material properties, the node links and the images of a material to the hash.
+    Images with a file on disk are hashed by their modification time, packed and generated images by their content
+    """
+    if material is None:
+        h.update(b"no material;")
+        return
+    h.update(material.name.encode())
+    hash_property_group(h, material.prim_material_properties)
+    if material.node_tree is None:
+        return
+    # the exported textures depend on which input of which node every image is linked to
+    for link in material.node_tree.links:
+        h.update(
+            repr(
+                (
+                    link.from_node.name,
+                    link.from_socket.identifier,
+                    link.to_node.name,
+                    link.to_socket.identifier,
+                )
+            ).encode()
+        )
+    for node in material.node_tree.nodes:
+        if node.type == "TEX_IMAGE" and node.image is not None:
+            hash_image(h, node.name, node.image)
+
+
+def hash_image(h, node_name, image):
+    path = bpy.path.abspath(image.filepath)
+    h.update(repr((node_name, image.name, path, image.is_dirty, image.size[:])).encode())
+    if image.packed_file is not None:
+        h.update(repr(("packed", image.packed_file.size)).encode())
+    if image.is_dirty or image.packed_file is not None or not os.path.isfile(path):
+        # the pixels of generated, packed and edited images are not reflected by a file on disk
+        if image.has_data:
+            pixels = np.empty(len(image.pixels), dtype=np.float32)
+            image.pixels.foreach_get(pixels)
+            h.update(pixels.tobytes())
+    else:
+        h.update(repr(("mtime", os.path.getmtime(path))).encode())
+
+
+def get_collection_fingerprint(collection, mesh_obs, meshes, export_options):
+    """
+    Hashes everything the exported files of a collection depend on:
+    the evaluated geometry, transforms, PRIM properties and materials of every object and the export options
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((EXPORT_RECORD_VERSION, collection.name, export_options)).encode())
+    hash_property_group(h, collection.prim_collection_properties)
+
+    for ob in mesh_obs:
+        h.update(ob.name.encode())
+        h.update(np.array(ob.matrix_world, dtype=np.float64).tobytes())
+        h.update(np.array(ob.dimensions, dtype=np.float64).tobytes())
+        hash_property_group(h, ob.data.prim_properties)
+        hash_property_group(h, ob.data.prim_physics_properties)
+        for slot in ob.material_slots:
+            hash_material(h, slot.material)
+
+        is_collider = ob.name.startswith(COLLIDER_PREFIXES)
+        if is_collider and not ob.name.startswith(
+            ("ConvexMeshCollider", "TriangleMeshCollider")
+        ):
+            continue
+        if not is_collider and not ob.data.uv_layers:
+            # the export itself reports the missing UV map
+            continue
+        evaluated = meshes.get(ob, attributes=not is_collider)
+        arrays = [
+            evaluated.locs,
+            evaluated.vertex_indices,
+            evaluated.loop_triangles,
+            evaluated.normals,
+            evaluated.tangents,
+            evaluated.bitangents,
+            evaluated.colors,
+        ] + evaluated.uvs
+        for array in arrays:
+            if array is not None:
+                h.update(np.ascontiguousarray(array).tobytes())
+
+    return h.hexdigest()
+
+
+def read_export_record(record_path):
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_export_record(record_path, record):
+    """
+    Writes the record that lets the next export skip the collection.
+    Only call this after every file the record lists was written, a cancelled or failed export must not leave one
+    """
+    with open(record_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=4)
+
+
+def is_export_unchanged(record, fingerprint):
+    """The files of a collection can be kept when its fingerprint matches and none of them were removed"""
+    return (
+        record is not None
+        and record.get("fingerprint") == fingerprint
+        and all(os.path.exists(path) for path in record.get("files", []))
+    )
+
+
 def write_prim_meta(output_path, materials):
     meta_json = {
         "hash_value": "000D4DE6CA5229F8",
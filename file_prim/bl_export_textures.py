@@ -0,0 +1,177 @@
+"""
+Texture writing for the PRIM exporter.
+Textures are collected during the export and written once at the end: every image is read once,
+identical pixels are encoded once and files whose pixel hash matches their record are not written again.
+"""
+
+import os
+import json
+import struct
+import hashlib
+import shutil
+import threading
+import bpy
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import timing
+
+# converted pixels waiting for or being written by a worker, finish blocks while more are held
+MAX_PENDING_BYTES = 512 * 1024 * 1024
+
+
+class TextureExport:
+    """
+    Collects the textures of an export, finish writes them.
+    The written, copied and skipped textures are counted on report, a timing.TimingReport, when given
+    """
+
+    def __init__(self, max_workers=None, report=None):
+        self.max_workers = max_workers
+        self.report = report
+        # image name -> {output path: (texture size, meta format)}
+        self.images = {}
+        # pixel hash -> first file written with those pixels during this export
+        self.written = {}
+        self.written_lock = threading.Lock()
+
+    def add(self, image, output_path, texture_format: bytes):
+        """Queues the image to be written as a TGA to output_path, along with its .meta file"""
+        outputs = self.images.setdefault(image.name, {})
+        outputs[output_path] = (int(image.size[0]) * int(image.size[1]), texture_format)
+
+    def finish(self):
+        """
+        Writes every queued texture. The pixels are read and converted to bytes on the calling thread,
+        hashing, encoding and writing happens on a thread pool
+        """
+        max_workers = self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = []
+            pending_bytes = 0
+            for image_name, outputs in self.images.items():
+                image = bpy.data.images[image_name]
+                if image.is_float:
+                    # float buffers need the color management of save_render
+                    for output_path, (texture_size, texture_format) in outputs.items():
+                        image.save_render(output_path)
+                        write_texture_meta(output_path + b".meta", texture_size, texture_format)
+                        timing.count(self.report, textures_written=1)
+                    continue
+
+                width, height = image.size
+                pixels = np.empty(width * height * image.channels, dtype=np.float32)
+                image.pixels.foreach_get(pixels)
+                rgba = to_rgba8(pixels.reshape(height, width, image.channels))
+                del pixels
+                pending.append(
+                    (pool.submit(self.write_image_textures, rgba, outputs), rgba.nbytes)
+                )
+                pending_bytes += rgba.nbytes
+                while pending_bytes > MAX_PENDING_BYTES:
+                    write, num_bytes = pending.pop(0)
+                    write.result()
+                    pending_bytes -= num_bytes
+
+            for write, num_bytes in pending:
+                write.result()
+
+        self.images.clear()
+        self.written.clear()
+
+    def write_image_textures(self, rgba, outputs):
+        """
+        Writes the RGBA bytes of to_rgba8 to every output that is not up to date.
+        The TGA is encoded at most once, images with identical pixels are copied from the first file written
+        """
+        pixel_hash = hashlib.blake2b(rgba.tobytes(), digest_size=16).hexdigest()
+        tga = None
+        for output_path, (texture_size, texture_format) in outputs.items():
+            record_path = output_path + b".export.json"
+            if is_texture_unchanged(output_path, record_path, pixel_hash):
+                timing.count(self.report, textures_skipped=1)
+                continue
+
+            with self.written_lock:
+                source_path = self.written.get(pixel_hash)
+            if source_path is not None and source_path != output_path:
+                shutil.copyfile(source_path, output_path)
+                timing.count(self.report, textures_copied=1)
+            else:
+                if tga is None:
+                    tga = encode_tga(rgba)
+                with open(output_path, "wb") as f:
+                    f.write(tga)
+                timing.count(
+                    self.report, textures_written=1, texture_bytes=len(tga)
+                )
+                with self.written_lock:
+                    self.written.setdefault(pixel_hash, output_path)
+
+            write_texture_meta(output_path + b".meta", texture_size, texture_format)
+            with open(record_path, "w", encoding="utf-8") as f:
+                json.dump({"hash": pixel_hash}, f)
+
+
+def is_texture_unchanged(output_path, record_path, pixel_hash):
+    if not os.path.exists(output_path) or not os.path.exists(output_path + b".meta"):
+        return False
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("hash") == pixel_hash
+    except (OSError, ValueError):
+        return False
+
+
+def to_rgba8(pixels):
+    """
+    Converts float pixels of shape (height, width, channels) to uint8 RGBA,
+    with the same rounding as Blender's float to byte conversion. pixels is overwritten
+    """
+    height, width, channels = pixels.shape
+    np.clip(pixels, 0.0, 1.0, out=pixels)
+    pixels *= 255.0
+    pixels += 0.5
+    np.floor(pixels, out=pixels)
+
+    rgba = np.full((height, width, 4), 255, dtype=np.uint8)
+    if channels < 3:
+        rgba[:, :, :3] = pixels[:, :, :1]
+        if channels == 2:
+            rgba[:, :, 3] = pixels[:, :, 1]
+    else:
+        rgba[:, :, : min(channels, 4)] = pixels[:, :, :4]
+    return rgba
+
+
+def encode_tga(rgba):
+    """
+    Encodes uint8 RGBA pixels in Blender's bottom-to-top row order as an uncompressed 32 bit TGA.
+    Returns the bytes of the file
+    """
+    height, width = rgba.shape[:2]
+    bgra = rgba[:, :, [2, 1, 0, 3]]
+
+    # uncompressed true color, 8 alpha bits, origin at the bottom left
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, 2, 0, 0, 0, 0, 0, width, height, 32, 8)
+    return header + bgra.tobytes()
+
+
+def write_texture_meta(output_path, texture_size, format):
+    meta_data = b"\x00\x00\x00\x00\x48\x00\x00\x00"
+    meta_data += format
+    meta_data += b"\x00\x01"
+    scaling = b"\x00\x00\x00\x00\x00"
+    if texture_size == 32768 or texture_size == 65536:
+        scaling = b"\x01\x01\x00\x00\x00"
+    elif texture_size == 131072 or texture_size == 262144:
+        scaling = b"\x02\x02\x00\x00\x00"
+    elif texture_size == 524288 or texture_size == 1048576:
+        scaling = b"\x03\x03\x00\x00\x00"
+    elif texture_size == 2097152 or texture_size == 4194304:
+        scaling = b"\x04\x04\x00\x00\x00"
+    elif texture_size == 8388608 or texture_size == 16777216:
+        scaling = b"\x05\x05\x00\x00\x00"
+    meta_data += scaling
+    with open(output_path, "wb") as f:
+        f.write(meta_data)
@@ -1,58 +1,291 @@
+import io
 import os
+import time
+import hashlib
 import bpy
+import mathutils
+from bpy.app.handlers import persistent
 import numpy as np
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from . import format as prim_format
-from ..file_borg import format as borg_format
+from ..file_borg import bl_import_borg
 from .. import io_binary
+from .. import timing
 
 
-def load_prim(operator, context, collection, filepath, use_rig, rig_filepath):
-    """Imports a mesh from the given path"""
-
-    prim_name = bpy.path.display_name_from_filepath(filepath)
-    print("Started reading: " + str(prim_name) + "\n")
-
+def read_prim(filepath):
+    """
+    Reads and decodes a RenderPrimitive, does not touch any Blender data.
+    The file size and the time spent reading and decoding are stored in prim.read_stats
+    """
+    start = time.perf_counter()
     fp = os.fsencode(filepath)
-    file = open(fp, "rb")
-    br = io_binary.BinaryReader(file)
+    with open(fp, "rb") as file:
+        data = file.read()
+    read_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    br = io_binary.BinaryReader(io.BytesIO(data))
     prim = prim_format.RenderPrimitive()
     prim.read(br)
-    br.close()
+    prim.read_stats = {
+        "bytes": len(data),
+        "read": read_time,
+        "decode": time.perf_counter() - start,
+    }
+    return prim
+
+
+def read_prims(filepaths, max_workers=None):
+    """
+    Reads and decodes the given PRIM files on a thread pool, the vertex decoding is done by numpy
+    which releases the GIL. Yields (filepath, RenderPrimitive) pairs in submission order,
+    so the caller can build the Blender data while the next files are still being decoded
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    paths = iter(filepaths)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque(
+            (path, pool.submit(read_prim, path))
+            for path in itertools.islice(paths, max_workers * 2)
+        )
+        while pending:
+            path, future = pending.popleft()
+            for next_path in itertools.islice(paths, 1):
+                pending.append((next_path, pool.submit(read_prim, next_path)))
+            yield path, future.result()
+
+
+class InstancingReport:
+    """Keeps track of the meshes that were reused instead of rebuilt during an import"""
+
+    def __init__(self):
+        self.meshes_built = 0
+        self.meshes_reused = 0
+        self.vertices_saved = 0
+        self.triangles_saved = 0
+
+    def summary(self):
+        return "Built %d meshes, reused %d (saved %d vertices, %d triangles)" % (
+            self.meshes_built,
+            self.meshes_reused,
+            self.vertices_saved,
+            self.triangles_saved,
+        )
+
 
-    if prim.header.bone_rig_resource_index == 0xFFFFFFFF:
+# content hash of a sub mesh -> name of the mesh that was built for it
+mesh_cache = {}
+
+# session_uid of the cached meshes whose data hash was checked since they were last updated
+verified_meshes = set()
+
+
+@persistent
+def forget_verified_meshes(scene, depsgraph=None):
+    if depsgraph is None:
+        verified_meshes.clear()
+        return
+    for update in depsgraph.updates:
+        if isinstance(update.id.original, bpy.types.Mesh):
+            verified_meshes.discard(update.id.original.session_uid)
+
+
+def get_sub_mesh_hash(prim, borg, mesh_index: int):
+    """Hashes the decoded vertices, indices and properties of a sub mesh"""
+    prim_mesh = prim.header.object_table[mesh_index]
+    sub_mesh = prim_mesh.sub_mesh
+    positions, colors, uvs, joints, weights = get_sub_mesh_arrays(sub_mesh)
+
+    content = hashlib.blake2b(digest_size=16)
+    content.update(positions.tobytes())
+    content.update(colors.tobytes())
+    content.update(np.ascontiguousarray(uvs).tobytes())
+    content.update(np.asarray(sub_mesh.indices, dtype=np.int32).tobytes())
+    if borg is not None and prim.header.property_flags.isWeightedObject():
+        content.update(np.ascontiguousarray(joints).tobytes())
+        content.update(np.ascontiguousarray(weights).tobytes())
+        content.update(b"/".join(bone.name for bone in borg.bone_definitions))
+
+    properties = (
+        prim_mesh.prim_object.lodmask,
+        prim_mesh.prim_object.material_id,
+        prim_mesh.prim_object.prims.prim_header.type.name,
+        prim_mesh.prim_object.sub_type.name,
+        prim_mesh.prim_object.properties.bitfield,
+        prim_mesh.prim_object.zbias,
+        prim_mesh.prim_object.zoffset,
+        sub_mesh.prim_object.properties.bitfield,
+        sub_mesh.prim_object.variant_id,
+        list(sub_mesh.prim_object.color1),
+        sub_mesh.num_uvchannels,
+    )
+    content.update(repr(properties).encode())
+    return content.hexdigest()
+
+
+def get_mesh_data_hash(mesh):
+    """
+    Hashes the Blender data of a mesh: positions, faces, UVs, colors and PRIM properties.
+    Tells whether an imported mesh was edited after it was built
+    """
+    data = hashlib.blake2b(digest_size=16)
+
+    positions = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    data.update(positions.tobytes())
+
+    vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", vertex_indices)
+    data.update(vertex_indices.tobytes())
+
+    for layer in mesh.uv_layers:
+        uvs = np.empty(len(layer.data) * 2, dtype=np.float32)
+        layer.data.foreach_get("uv", uvs)
+        data.update(uvs.tobytes())
+
+    for attribute in mesh.color_attributes:
+        colors = np.empty(len(attribute.data) * 4, dtype=np.float32)
+        attribute.data.foreach_get("color", colors)
+        data.update(colors.tobytes())
+
+    properties = []
+    for prop in mesh.prim_properties.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(mesh.prim_properties, prop.identifier)
+        if getattr(prop, "is_array", False):
+            value = value[:]
+        properties.append((prop.identifier, value))
+    data.update(repr(properties).encode())
+    return data.hexdigest()
+
+
+def get_cached_mesh(mesh_hash: str):
+    """
+    Returns the mesh built for the given content hash, if it still exists and was not edited since.
+    Edited meshes are dropped from the cache, the sub mesh is built again.
+    The data of a mesh is only hashed again after a depsgraph update touched it
+    """
+    mesh_name = mesh_cache.get(mesh_hash)
+    if mesh_name is None:
+        return None
+    mesh = bpy.data.meshes.get(mesh_name)
+    if mesh is None or mesh.get("glacier_mesh_hash") != mesh_hash:
+        del mesh_cache[mesh_hash]
+        return None
+    if mesh.session_uid not in verified_meshes:
+        if mesh.get("glacier_mesh_data_hash") != get_mesh_data_hash(mesh):
+            del mesh_cache[mesh_hash]
+            return None
+        verified_meshes.add(mesh.session_uid)
+    return mesh
+
+
+def set_collection_properties(collection, header):
+    """Copies the bone rig index and the flags of a PRIM header to the collection the PRIM is imported into"""
+    if header.bone_rig_resource_index == 0xFFFFFFFF:
         collection.prim_collection_properties.bone_rig_resource_index = -1
     else:
         collection.prim_collection_properties.bone_rig_resource_index = (
-            prim.header.bone_rig_resource_index
+            header.bone_rig_resource_index
         )
-    collection.prim_collection_properties.has_bones = (
-        prim.header.property_flags.hasBones()
-    )
+    collection.prim_collection_properties.has_bones = header.property_flags.hasBones()
     collection.prim_collection_properties.has_frames = (
-        prim.header.property_flags.hasFrames()
+        header.property_flags.hasFrames()
     )
     collection.prim_collection_properties.is_weighted = (
-        prim.header.property_flags.isWeightedObject()
+        header.property_flags.isWeightedObject()
     )
     collection.prim_collection_properties.is_linked = (
-        prim.header.property_flags.isLinkedObject()
+        header.property_flags.isLinkedObject()
     )
 
+
+def get_prim_mesh(
+    prim,
+    borg,
+    prim_name: str,
+    mesh_index: int,
+    fast_validation=False,
+    instancing=None,
+    report=None,
+):
+    """
+    Builds the mesh of a sub mesh.
+    When an InstancingReport is given, a mesh that was already built for the same content is returned instead
+    """
+    if instancing is None:
+        return load_prim_mesh(
+            prim, borg, prim_name, mesh_index, fast_validation, report
+        )
+
+    with timing.stage(report, "instancing"):
+        mesh_hash = get_sub_mesh_hash(prim, borg, mesh_index)
+    mesh = get_cached_mesh(mesh_hash)
+    if mesh is None:
+        mesh = load_prim_mesh(prim, borg, prim_name, mesh_index, fast_validation, report)
+        mesh["glacier_mesh_hash"] = mesh_hash
+        mesh["glacier_mesh_data_hash"] = get_mesh_data_hash(mesh)
+        mesh_cache[mesh_hash] = mesh.name
+        verified_meshes.add(mesh.session_uid)
+        instancing.meshes_built += 1
+    else:
+        instancing.meshes_reused += 1
+        instancing.vertices_saved += len(mesh.vertices)
+        instancing.triangles_saved += len(mesh.polygons)
+    return mesh
+
+
+def load_prim(
+    operator,
+    context,
+    collection,
+    filepath,
+    use_rig,
+    rig_filepath,
+    prim=None,
+    instancing=None,
+    fast_validation=False,
+    report=None,
+):
+    """
+    Imports a mesh from the given path, prim can be given when it has already been read.
+    When an InstancingReport is given, sub meshes that were imported before are linked to the existing mesh.
+    Timings and counts are added to report, a timing.TimingReport, when given
+    """
+
+    prim_name = bpy.path.display_name_from_filepath(filepath)
+    print("Started reading: " + str(prim_name) + "\n")
+
+    if prim is None:
+        prim = read_prim(filepath)
+
+    timing.add_time(report, "read", prim.read_stats["read"])
+    timing.add_time(report, "decode", prim.read_stats["decode"])
+    timing.count(report, bytes=prim.read_stats["bytes"])
+
+    set_collection_properties(collection, prim.header)
+
     borg = None
     if use_rig:
-        borg_name = bpy.path.display_name_from_filepath(filepath)
-        print("Started reading: " + str(borg_name) + "\n")
-        fp = os.fsencode(rig_filepath)
-        file = open(fp, "rb")
-        br = io_binary.BinaryReader(file)
-        borg = borg_format.BoneRig()
-        borg.read(br)
+        with timing.stage(report, "rig"):
+            borg = bl_import_borg.get_rig(rig_filepath).borg
 
     objects = []
     for meshIndex in range(prim.num_objects()):
-        mesh = load_prim_mesh(prim, borg, prim_name, meshIndex)
-        obj = bpy.data.objects.new(mesh.name, mesh)
+        mesh = get_prim_mesh(
+            prim, borg, prim_name, meshIndex, fast_validation, instancing, report
+        )
+        if instancing is None:
+            obj = bpy.data.objects.new(mesh.name, mesh)
+        else:
+            obj = bpy.data.objects.new(str(prim_name) + "_" + str(meshIndex), mesh)
         objects.append(obj)
 
         # coli testing
@@ -61,6 +294,124 @@ def load_prim(operator, context, collection, filepath, use_rig, rig_filepath):
     return objects
 
 
+def load_prim_placeholders(
+    filepath, collection=None, rig_filepath="", armature=None, instance_meshes=False
+):
+    """
+    Creates a bounding box placeholder for every mesh in the PRIM at the given path,
+    only the headers are read. The geometry can be loaded later with load_placeholder_geometry.
+    The header is copied to the properties of collection when given.
+    The rig, armature object and instancing option are stored on the placeholders for load_placeholder_geometry.
+    Returns the placeholder objects
+    """
+    prim_name = bpy.path.display_name_from_filepath(filepath)
+
+    fp = os.fsencode(filepath)
+    with open(fp, "rb") as file:
+        br = io_binary.BinaryReader(file)
+        header, prim_objects = prim_format.readObjectHeaders(br)
+
+    if collection is not None:
+        set_collection_properties(collection, header)
+
+    objects = []
+    for mesh_index, prim_object in enumerate(prim_objects):
+        bb_min = mathutils.Vector(prim_object.min)
+        bb_max = mathutils.Vector(prim_object.max)
+
+        obj = bpy.data.objects.new(str(prim_name) + "_" + str(mesh_index), None)
+        obj.empty_display_type = "CUBE"
+        obj.location = (bb_min + bb_max) / 2
+        obj.scale = [max((bb_max[axis] - bb_min[axis]) / 2, 0.0001) for axis in range(3)]
+
+        obj["glacier_prim_path"] = filepath
+        obj["glacier_prim_index"] = mesh_index
+        obj["glacier_prim_flags"] = header.property_flags.bitfield
+        obj["glacier_lodmask"] = prim_object.lodmask
+        obj["glacier_bounds"] = list(prim_object.min) + list(prim_object.max)
+        if rig_filepath:
+            obj["glacier_rig_filepath"] = rig_filepath
+        if armature is not None:
+            obj["glacier_armature"] = armature.name
+        obj["glacier_instance_meshes"] = instance_meshes
+        objects.append(obj)
+
+    return objects
+
+
+def is_placeholder(obj):
+    return obj.type == "EMPTY" and "glacier_prim_path" in obj
+
+
+def load_placeholder_geometry(placeholders, instancing=None):
+    """
+    Replaces the given placeholders with their mesh, every PRIM is decoded once.
+    Transforms made to a placeholder are carried over to the mesh object,
+    the rig and instancing options of the import that created the placeholder are used.
+    Built and reused meshes are counted on instancing.
+    Returns the created objects
+    """
+    if instancing is None:
+        instancing = InstancingReport()
+    by_path = {}
+    for placeholder in placeholders:
+        by_path.setdefault(placeholder["glacier_prim_path"], []).append(placeholder)
+
+    objects = []
+    for filepath, prim in read_prims(list(by_path)):
+        prim_name = bpy.path.display_name_from_filepath(filepath)
+        meshes = {}
+        for placeholder in by_path[filepath]:
+            mesh_index = placeholder["glacier_prim_index"]
+            if mesh_index >= prim.num_objects():
+                continue
+            rig_filepath = placeholder.get("glacier_rig_filepath", "")
+            key = (mesh_index, rig_filepath)
+            if key not in meshes:
+                borg = None
+                if rig_filepath:
+                    borg = bl_import_borg.get_rig(rig_filepath).borg
+                meshes[key] = get_prim_mesh(
+                    prim,
+                    borg,
+                    prim_name,
+                    mesh_index,
+                    True,
+                    instancing if placeholder.get("glacier_instance_meshes") else None,
+                )
+                meshes[key].polygons.foreach_set(
+                    "use_smooth", [True] * len(meshes[key].polygons)
+                )
+            obj = bpy.data.objects.new(placeholder.name, meshes[key])
+
+            armature = bpy.data.objects.get(placeholder.get("glacier_armature", ""))
+            if rig_filepath and armature is not None:
+                obj.modifiers.new(name="Glacier Bonerig", type="ARMATURE")
+                obj.modifiers["Glacier Bonerig"].object = armature
+
+            bounds = placeholder["glacier_bounds"]
+            bb_min = mathutils.Vector(bounds[0:3])
+            bb_max = mathutils.Vector(bounds[3:6])
+            rest_matrix = mathutils.Matrix.LocRotScale(
+                (bb_min + bb_max) / 2,
+                None,
+                [max((bb_max[axis] - bb_min[axis]) / 2, 0.0001) for axis in range(3)],
+            )
+            matrix_world = placeholder.matrix_world @ rest_matrix.inverted()
+
+            for collection in placeholder.users_collection:
+                collection.objects.link(obj)
+            obj.parent = placeholder.parent
+            obj.matrix_world = matrix_world
+
+            name = placeholder.name
+            bpy.data.objects.remove(placeholder)
+            obj.name = name
+            objects.append(obj)
+
+    return objects
+
+
 def load_prim_coli(prim, prim_name: str, mesh_index: int):
     """Testing class for the prim BoxColi"""
     for b, boxColi in enumerate(prim.header.object_table[mesh_index].sub_mesh.collision.box_entries):
@@ -98,22 +449,180 @@ def load_prim_coli(prim, prim_name: str, mesh_index: int):
         me.name = "CUBEMESH"
 
 
-def load_prim_mesh(prim, borg, prim_name: str, mesh_index: int):
+loop_start_cache = np.zeros(0, dtype=np.int32)
+loop_total_cache = np.zeros(0, dtype=np.int32)
+
+
+def get_loop_starts_and_totals(num_faces: int):
+    """
+    Returns the loop_start and loop_total arrays for a mesh made of num_faces triangles.
+    The arrays are cached and grown when needed, so consecutive imports only slice them
+    """
+    global loop_start_cache, loop_total_cache
+    if len(loop_start_cache) < num_faces:
+        loop_start_cache = np.arange(0, 3 * num_faces, step=3, dtype=np.int32)
+        loop_total_cache = np.full(num_faces, 3, dtype=np.int32)
+    return loop_start_cache[:num_faces], loop_total_cache[:num_faces]
+
+
+def get_sub_mesh_arrays(sub_mesh):
+    """
+    Collects the decoded vertices of a PrimSubMesh into numpy arrays.
+    Returns the positions (N, 3), colors (N, 4), uvs (channels, N, 2), joints (2, N, 4) and weights (2, N, 4)
+    """
+    vertex_buffer = sub_mesh.vertexBuffer
+    num_uvchannels = sub_mesh.num_uvchannels
+
+    if vertex_buffer.positions is not None:
+        return (
+            vertex_buffer.positions[:, :3].astype(np.float32),
+            vertex_buffer.colors,
+            vertex_buffer.uvs[:, :num_uvchannels].astype(np.float32).transpose(1, 0, 2),
+            vertex_buffer.joints.astype(np.int32).transpose(1, 0, 2),
+            vertex_buffer.weights.astype(np.float32).transpose(1, 0, 2),
+        )
+
+    vertices = vertex_buffer.vertices
+    num_vertices = len(vertices)
+
+    positions = np.array(
+        [vert.position[:3] for vert in vertices], dtype=np.float32
+    ).reshape(num_vertices, 3)
+    colors = np.array([vert.color for vert in vertices], dtype=np.uint8).reshape(
+        num_vertices, 4
+    )
+    uvs = (
+        np.array([vert.uv[:num_uvchannels] for vert in vertices], dtype=np.float32)
+        .reshape(num_vertices, num_uvchannels, 2)
+        .transpose(1, 0, 2)
+    )
+    joints = (
+        np.array([vert.joint for vert in vertices], dtype=np.int32)
+        .reshape(num_vertices, 2, 4)
+        .transpose(1, 0, 2)
+    )
+    weights = (
+        np.array([vert.weight for vert in vertices], dtype=np.float32)
+        .reshape(num_vertices, 2, 4)
+        .transpose(1, 0, 2)
+    )
+    return positions, colors, uvs, joints, weights
+
+
+def get_vertex_group_batches(joints, weights):
+    """
+    Groups the skin influences of a mesh by bone and weight, so every vertex group
+    only needs a few bulk adds instead of one add per vertex per influence.
+    joints and weights are (joint sets, N, 4) arrays, zero weights are skipped.
+    When a vertex references the same bone more than once the last influence wins,
+    matching consecutive adds in REPLACE mode.
+    Returns a list of (bone, weight, vertex indices) tuples
+    """
+    num_sets, num_vertices, num_slots = joints.shape
+    vertex_ids = np.broadcast_to(
+        np.arange(num_vertices)[None, :, None], joints.shape
+    )
+
+    # flatten in the order the influences used to be added: joint set, slot, vertex
+    bones = joints.transpose(0, 2, 1).ravel()
+    values = weights.transpose(0, 2, 1).ravel()
+    vertex_ids = vertex_ids.transpose(0, 2, 1).ravel()
+
+    used = values != 0
+    bones = bones[used]
+    values = values[used]
+    vertex_ids = vertex_ids[used]
+    if len(bones) == 0:
+        return []
+
+    # keep the last influence of every (vertex, bone) pair, lexsort is stable
+    order = np.lexsort((vertex_ids, bones))
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (bones[order][1:] != bones[order][:-1]) | (
+        vertex_ids[order][1:] != vertex_ids[order][:-1]
+    )
+    order = order[last]
+    bones = bones[order]
+    values = values[order]
+    vertex_ids = vertex_ids[order]
+
+    order = np.lexsort((vertex_ids, values, bones))
+    bones = bones[order]
+    values = values[order]
+    vertex_ids = vertex_ids[order]
+    starts = np.flatnonzero(
+        np.r_[True, (bones[1:] != bones[:-1]) | (values[1:] != values[:-1])]
+    )
+    ends = np.r_[starts[1:], len(bones)]
+
+    return [
+        (int(bones[start]), float(values[start]), vertex_ids[start:end].tolist())
+        for start, end in zip(starts, ends)
+    ]
+
+
+def check_sub_mesh_arrays(positions, uvs, indices):
+    """
+    Vectorized version of the checks mesh.validate() does on imported meshes:
+    index bounds, degenerate and duplicate triangles and non-finite positions or UVs.
+    Returns a list of the problems that were found, empty when the mesh can be trusted
+    """
+    problems = []
+    num_vertices = len(positions)
+
+    if len(indices) % 3 != 0:
+        problems.append("index count %d is not a multiple of 3" % len(indices))
+    tris = indices[: len(indices) // 3 * 3].reshape(-1, 3)
+
+    out_of_bounds = np.any((tris < 0) | (tris >= num_vertices), axis=1)
+    if out_of_bounds.any():
+        problems.append("%d triangles index past the vertex buffer" % out_of_bounds.sum())
+    tris = tris[~out_of_bounds]
+
+    degenerate = (
+        (tris[:, 0] == tris[:, 1])
+        | (tris[:, 1] == tris[:, 2])
+        | (tris[:, 0] == tris[:, 2])
+    )
+    if degenerate.any():
+        problems.append("%d degenerate triangles" % degenerate.sum())
+
+    num_unique = len(np.unique(np.sort(tris[~degenerate], axis=1), axis=0))
+    num_duplicate = len(tris) - degenerate.sum() - num_unique
+    if num_duplicate:
+        problems.append("%d duplicate triangles" % num_duplicate)
+
+    num_nan_positions = (~np.isfinite(positions).all(axis=1)).sum()
+    if num_nan_positions:
+        problems.append("%d vertices with a non-finite position" % num_nan_positions)
+    num_nan_uvs = (~np.isfinite(uvs).all(axis=2)).sum()
+    if num_nan_uvs:
+        problems.append("%d non-finite UVs" % num_nan_uvs)
+
+    return problems
+
+
+def load_prim_mesh(
+    prim,
+    borg,
+    prim_name: str,
+    mesh_index: int,
+    fast_validation: bool = False,
+    report=None,
+):
     """
     Turn the prim data structure into a Blender mesh.
+    With fast_validation, mesh.validate() only runs when the vectorized checks find a problem.
+    Timings and counts are added to report when given.
     Returns the generated Mesh
     """
+    mesh_start = time.perf_counter()
     mesh = bpy.data.meshes.new(name=(str(prim_name) + "_" + str(mesh_index)))
 
     use_rig = False
     if borg is not None:
         use_rig = True
 
-    vert_locs = []
-    loop_vidxs = []
-    loop_uvs = [[]]
-    loop_cols = []
-
     num_joint_sets = 0
 
     if prim.header.property_flags.isWeightedObject() and use_rig:
@@ -121,57 +630,48 @@ def load_prim_mesh(prim, borg, prim_name: str, mesh_index: int):
 
     sub_mesh = prim.header.object_table[mesh_index].sub_mesh
 
-    vert_joints = [
-        [[0] * 4 for _ in range(len(sub_mesh.vertexBuffer.vertices))]
-        for _ in range(num_joint_sets)
-    ]
-    vert_weights = [
-        [[0] * 4 for _ in range(len(sub_mesh.vertexBuffer.vertices))]
-        for _ in range(num_joint_sets)
-    ]
-
-    loop_vidxs.extend(sub_mesh.indices)
+    positions, colors, uvs, joints, weights = get_sub_mesh_arrays(sub_mesh)
+    indices = np.array(sub_mesh.indices, dtype=np.int32)
 
-    for i, vert in enumerate(sub_mesh.vertexBuffer.vertices):
-        vert_locs.extend([vert.position[0], vert.position[1], vert.position[2]])
+    timing.count(report, vertices=len(positions), triangles=len(indices) // 3)
 
-        for j in range(num_joint_sets):
-            vert_joints[j][i] = vert.joint[j]
-            vert_weights[j][i] = vert.weight[j]
+    problems = []
+    corner_vidxs = indices
+    if fast_validation:
+        with timing.stage(report, "validate"):
+            problems = check_sub_mesh_arrays(positions, uvs, indices)
+        for problem in problems:
+            print("[%s_%d] %s" % (prim_name, mesh_index, problem))
+        # keep the attribute lookup in range, validate() removes the broken faces
+        corner_vidxs = np.clip(indices, 0, max(len(positions) - 1, 0))
 
-    for index in sub_mesh.indices:
-        vert = sub_mesh.vertexBuffer.vertices[index]
-        loop_cols.extend(
-            [
-                vert.color[0] / 255,
-                vert.color[1] / 255,
-                vert.color[2] / 255,
-                vert.color[3] / 255,
-            ]
-        )
-        for uv_i in range(sub_mesh.num_uvchannels):
-            loop_uvs[uv_i].extend([vert.uv[uv_i][0], 1 - vert.uv[uv_i][1]])
+    # loop attributes are looked up per corner, the V coordinate is flipped for Blender
+    loop_cols = (colors[corner_vidxs].astype(np.float32) / 255).ravel()
+    loop_uvs = uvs[:, corner_vidxs]
+    loop_uvs[:, :, 1] = 1 - loop_uvs[:, :, 1]
 
-    mesh.vertices.add(len(vert_locs) // 3)
-    mesh.vertices.foreach_set("co", vert_locs)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", positions.ravel())
 
-    mesh.loops.add(len(loop_vidxs))
-    mesh.loops.foreach_set("vertex_index", loop_vidxs)
+    mesh.loops.add(len(indices))
+    mesh.loops.foreach_set("vertex_index", indices)
 
-    num_faces = len(sub_mesh.indices) // 3
+    num_faces = len(indices) // 3
     mesh.polygons.add(num_faces)
 
-    loop_starts = np.arange(0, 3 * num_faces, step=3)
-    loop_totals = np.full(num_faces, 3)
+    loop_starts, loop_totals = get_loop_starts_and_totals(num_faces)
     mesh.polygons.foreach_set("loop_start", loop_starts)
     mesh.polygons.foreach_set("loop_total", loop_totals)
 
     for uv_i in range(sub_mesh.num_uvchannels):
         name = "UVMap" if uv_i == 0 else "UVMap.%03d" % uv_i
         layer = mesh.uv_layers.new(name=name)
-        layer.data.foreach_set("uv", loop_uvs[uv_i])
+        layer.data.foreach_set("uv", loop_uvs[uv_i].ravel())
+
+    timing.add_time(report, "mesh", time.perf_counter() - mesh_start)
 
     # Skinning
+    skinning_start = time.perf_counter()
     ob = bpy.data.objects.new("temp_obj", mesh)
     if num_joint_sets and use_rig:
         for bone in borg.bone_definitions:
@@ -179,27 +679,21 @@ def load_prim_mesh(prim, borg, prim_name: str, mesh_index: int):
 
         vgs = list(ob.vertex_groups)
 
-        for i in range(num_joint_sets):
-            js = vert_joints[i]
-            ws = vert_weights[i]
-            for vi in range(len(vert_locs) // 3):
-                w0, w1, w2, w3 = ws[vi]
-                j0, j1, j2, j3 = js[vi]
-                if w0 != 0:
-                    vgs[j0].add((vi,), w0, "REPLACE")
-                if w1 != 0:
-                    vgs[j1].add((vi,), w1, "REPLACE")
-                if w2 != 0:
-                    vgs[j2].add((vi,), w2, "REPLACE")
-                if w3 != 0:
-                    vgs[j3].add((vi,), w3, "REPLACE")
+        for bone, weight, vertex_indices in get_vertex_group_batches(
+            joints[:num_joint_sets], weights[:num_joint_sets]
+        ):
+            vgs[bone].add(vertex_indices, weight, "REPLACE")
     bpy.data.objects.remove(ob)
+    timing.add_time(report, "skinning", time.perf_counter() - skinning_start)
 
-    layer = mesh.vertex_colors.new(name="Col")
-    mesh.color_attributes[layer.name].data.foreach_set("color", loop_cols)
+    with timing.stage(report, "mesh"):
+        layer = mesh.vertex_colors.new(name="Col")
+        mesh.color_attributes[layer.name].data.foreach_set("color", loop_cols)
 
-    mesh.validate()
-    mesh.update()
+    with timing.stage(report, "validate"):
+        if not fast_validation or problems:
+            mesh.validate()
+        mesh.update()
 
     # write the additional properties to the blender structure
     prim_mesh_obj = prim.header.object_table[mesh_index].prim_object
@@ -1,6 +1,8 @@
 import enum
 import sys
 
+import numpy as np
+
 """
 The RenderPrimitive format:
 
@@ -400,10 +402,39 @@ class PrimMeshWeighted(PrimMesh):
 
 
 class VertexBuffer:
-    """A helper class used to store and manage the vertices found inside a PrimSubMesh"""
+    """
+    A helper class used to store and manage the vertices found inside a PrimSubMesh.
+    Vertices read from a file are decoded into numpy arrays, the Vertex objects are only built when accessed
+    """
 
     def __init__(self):
-        self.vertices = []
+        self._vertices = []
+        self.positions = None
+        self.weights = None
+        self.joints = None
+        self.normals = None
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = None
+        self.colors = None
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            self._vertices = self.build_vertices()
+        return self._vertices
+
+    @vertices.setter
+    def vertices(self, vertices):
+        self._vertices = vertices
+        self.positions = None
+        self.weights = None
+        self.joints = None
+        self.normals = None
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = None
+        self.colors = None
 
     def read(
         self,
@@ -415,67 +446,88 @@ class VertexBuffer:
         sub_mesh_flags: PrimObjectPropertyFlags,
         flags: PrimObjectHeaderPropertyFlags,
     ):
-        self.vertices = [Vertex() for _ in range(num_vertices)]
-
-        for vertex in self.vertices:
-            if mesh.prim_object.properties.isHighResolution():
-                vertex.position[0] = (
-                    br.readFloat() * mesh.pos_scale[0]
-                ) + mesh.pos_bias[0]
-                vertex.position[1] = (
-                    br.readFloat() * mesh.pos_scale[1]
-                ) + mesh.pos_bias[1]
-                vertex.position[2] = (
-                    br.readFloat() * mesh.pos_scale[2]
-                ) + mesh.pos_bias[2]
-                vertex.position[3] = 1
-            else:
-                vertex.position = br.readShortQuantizedVecScaledBiased(
-                    4, mesh.pos_scale, mesh.pos_bias
-                )
+        if mesh.prim_object.properties.isHighResolution():
+            positions = np.frombuffer(
+                br.file.read(num_vertices * 12), dtype="<f4"
+            ).reshape(num_vertices, 3)
+            positions = positions * np.array(mesh.pos_scale[:3]) + np.array(
+                mesh.pos_bias[:3]
+            )
+            positions = np.c_[positions, np.ones(num_vertices)]
+        else:
+            positions = np.frombuffer(
+                br.file.read(num_vertices * 8), dtype="<i2"
+            ).reshape(num_vertices, 4)
+            positions = (positions * np.array(mesh.pos_scale)) / 0x7FFF + np.array(
+                mesh.pos_bias
+            )
 
+        weights = np.zeros((num_vertices, 2, 4))
+        joints = np.zeros((num_vertices, 2, 4), dtype=np.uint8)
         if flags.isWeightedObject():
-            for vertex in self.vertices:
-                vertex.weight[0][0] = br.readUByte() / 255
-                vertex.weight[0][1] = br.readUByte() / 255
-                vertex.weight[0][2] = br.readUByte() / 255
-                vertex.weight[0][3] = br.readUByte() / 255
-
-                vertex.joint[0][0] = br.readUByte()
-                vertex.joint[0][1] = br.readUByte()
-                vertex.joint[0][2] = br.readUByte()
-                vertex.joint[0][3] = br.readUByte()
-
-                vertex.weight[1][0] = br.readUByte() / 255
-                vertex.weight[1][1] = br.readUByte() / 255
-                vertex.weight[1][2] = 0
-                vertex.weight[1][3] = 0
-
-                vertex.joint[1][0] = br.readUByte()
-                vertex.joint[1][1] = br.readUByte()
-                vertex.joint[1][2] = 0
-                vertex.joint[1][3] = 0
-
-        for vertex in self.vertices:
-            vertex.normal = br.readUByteQuantizedVec(4)
-            vertex.tangent = br.readUByteQuantizedVec(4)
-            vertex.bitangent = br.readUByteQuantizedVec(4)
-            vertex.uv = [0] * num_uvchannels
-            for uv in range(num_uvchannels):
-                vertex.uv[uv] = br.readShortQuantizedVecScaledBiased(
-                    2, mesh.tex_scale_bias[0:2], mesh.tex_scale_bias[2:4]
-                )
+            skin = np.frombuffer(
+                br.file.read(num_vertices * 12), dtype=np.uint8
+            ).reshape(num_vertices, 12)
+            weights[:, 0] = skin[:, 0:4] / 255
+            joints[:, 0] = skin[:, 4:8]
+            weights[:, 1, :2] = skin[:, 8:10] / 255
+            joints[:, 1, :2] = skin[:, 10:12]
+
+        ntb_uv_type = np.dtype(
+            [("ntb", np.uint8, (3, 4)), ("uv", "<i2", (num_uvchannels, 2))]
+        )
+        ntb_uv = np.frombuffer(
+            br.file.read(num_vertices * ntb_uv_type.itemsize), dtype=ntb_uv_type
+        )
+        ntb = ((ntb_uv["ntb"] * 2.0) / 255) - 1
+        uvs = (ntb_uv["uv"] * np.array(mesh.tex_scale_bias[0:2])) / 0x7FFF + np.array(
+            mesh.tex_scale_bias[2:4]
+        )
 
+        colors = np.full((num_vertices, 4), 0xFF, dtype=np.uint8)
         if not mesh.prim_object.properties.useColor1() or flags.isWeightedObject():
             if not sub_mesh_flags.useColor1():
-                for vertex in self.vertices:
-                    vertex.color = br.readUByteVec(4)
+                colors = np.frombuffer(
+                    br.file.read(num_vertices * 4), dtype=np.uint8
+                ).reshape(num_vertices, 4)
             else:
-                for vertex in self.vertices:
-                    vertex.color[0] = sub_mesh_color1[0]
-                    vertex.color[1] = sub_mesh_color1[1]
-                    vertex.color[2] = sub_mesh_color1[2]
-                    vertex.color[3] = sub_mesh_color1[3]
+                colors[:] = sub_mesh_color1
+
+        self._vertices = None
+        self.positions = positions
+        self.weights = weights
+        self.joints = joints
+        self.normals = ntb[:, 0]
+        self.tangents = ntb[:, 1]
+        self.bitangents = ntb[:, 2]
+        self.uvs = uvs
+        self.colors = colors
+
+    def build_vertices(self):
+        """Turns the decoded vertex arrays into Vertex objects"""
+        if self.positions is None:
+            return []
+
+        positions = self.positions.tolist()
+        weights = self.weights.tolist()
+        joints = self.joints.tolist()
+        normals = self.normals.tolist()
+        tangents = self.tangents.tolist()
+        bitangents = self.bitangents.tolist()
+        uvs = self.uvs.tolist()
+        colors = self.colors.tolist()
+
+        vertices = [Vertex() for _ in range(len(positions))]
+        for i, vertex in enumerate(vertices):
+            vertex.position = positions[i]
+            vertex.weight = weights[i]
+            vertex.joint = joints[i]
+            vertex.normal = normals[i]
+            vertex.tangent = tangents[i]
+            vertex.bitangent = bitangents[i]
+            vertex.uv = uvs[i]
+            vertex.color = colors[i]
+        return vertices
 
     def write(
         self,
@@ -554,6 +606,8 @@ class PrimSubMesh:
         self.indices = [0] * 0
         self.collision = BoxColi()
         self.cloth = -1
+        # bytes taken by each section in the last write, including the alignment after it
+        self.section_sizes = {}
 
     def read(self, br, mesh: PrimMesh, flags: PrimObjectHeaderPropertyFlags):
         self.prim_object.read(br)
@@ -581,9 +635,9 @@ class PrimSubMesh:
 
         # detour for indices
         br.seek(indices_offset)
-        self.indices = [-1] * (num_indices + num_additional_indices)
-        for index in range(num_indices + num_additional_indices):
-            self.indices[index] = br.readUShort()
+        self.indices = np.frombuffer(
+            br.file.read((num_indices + num_additional_indices) * 2), dtype="<u2"
+        )
 
         # detour for collision info
         br.seek(collision_offset)
@@ -599,8 +653,7 @@ class PrimSubMesh:
 
     def write(self, br, mesh, flags: PrimObjectHeaderPropertyFlags):
         index_offset = br.tell()
-        for index in self.indices:
-            br.writeUShort(index)
+        br.writeHex(np.asarray(self.indices, dtype="<u2").tobytes())
 
         br.align(16)
         vert_offset = br.tell()
@@ -620,6 +673,12 @@ class PrimSubMesh:
             cloth_offset = 0
 
         header_offset = br.tell()
+        self.section_sizes = {
+            "indices": vert_offset - index_offset,
+            "vertices": coll_offset - vert_offset,
+            "boxcoli": (cloth_offset or header_offset) - coll_offset,
+            "cloth": header_offset - cloth_offset if cloth_offset else 0,
+        }
         # IOI uses a cleared primMesh object. so let's clear it here as well
         self.prim_object.lodmask = 0x0
         self.prim_object.wire_color = 0x0
@@ -958,6 +1017,35 @@ def readHeader(br):
     return header_values
 
 
+def readObjectHeaders(br):
+    """
+    Global function to read the header of a RenderPrimitive and the PrimObject of every mesh,
+    without decoding any geometry. Used to create placeholders.
+    Returns the header and a list of PrimObjects
+    """
+    offset = br.readUInt()
+    br.seek(offset)
+    header_values = PrimObjectHeader()
+    header_values.prims.read(br)
+    header_values.property_flags = PrimObjectHeaderPropertyFlags(br.readUInt())
+    header_values.bone_rig_resource_index = br.readUInt()
+    num_objects = br.readUInt()
+    object_table_offset = br.readUInt()
+    header_values.min = br.readFloatVec(3)
+    header_values.max = br.readFloatVec(3)
+
+    br.seek(object_table_offset)
+    object_table_offsets = [br.readUInt() for _ in range(num_objects)]
+
+    prim_objects = []
+    for object_offset in object_table_offsets:
+        br.seek(object_offset)
+        prim_object = PrimObject(2)
+        prim_object.read(br)
+        prim_objects.append(prim_object)
+    return header_values, prim_objects
+
+
 class RenderPrimitive:
     """
     RenderPrimitive class, represents the .prim file format.
@@ -0,0 +1,78 @@
+"""
+IOI path hashing and the hashlist.txt written next to exported files.
+The hashlist of an export directory is read back before every export and new entries are merged into it,
+so exporting into the same folder several times keeps the entries of the earlier exports.
+"""
+
+import os
+import hashlib
+import tempfile
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_ioi_path_and_hash(ioi_path):
+    ioi_path = ioi_path.lower()
+    ioi_hash = "00" + hashlib.md5(ioi_path.encode("utf-8")).hexdigest().upper()[2:16]
+    return ioi_path, ioi_hash
+
+
+class HashList:
+    """
+    The "HASH.TYPE,path" entries of a hashlist.txt, looked up by key with get_path or by path with get_keys.
+    Only writes the file when entries were added
+    """
+
+    def __init__(self, export_dir):
+        self.path = export_dir + os.sep.encode() + b"hashlist.txt"
+        self.entries = {}
+        self.keys_by_path = {}
+        self.changed = False
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    key, sep, path = line.rstrip("\n").partition(",")
+                    if sep:
+                        self.add(key, path)
+        self.changed = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def add(self, key, path):
+        """Adds the entry unless the key is already known, returns True when it was added"""
+        if key in self.entries:
+            return False
+        self.entries[key] = path
+        self.keys_by_path.setdefault(path, []).append(key)
+        self.changed = True
+        return True
+
+    def update(self, entries):
+        for key, path in entries.items():
+            self.add(key, path)
+
+    def get_path(self, key):
+        return self.entries.get(key)
+
+    def get_keys(self, path):
+        return self.keys_by_path.get(path, [])
+
+    def write(self):
+        """Replaces hashlist.txt with all entries, a failed write leaves the previous file intact"""
+        if not self.changed:
+            return
+        export_dir = os.path.dirname(self.path)
+        fd, temp_path = tempfile.mkstemp(dir=export_dir, suffix=b".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for key, path in self.entries.items():
+                    f.write(key + "," + path + "\n")
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.changed = False
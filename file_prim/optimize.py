@@ -0,0 +1,379 @@
+"""
+Mesh optimization helpers used when exporting a RenderPrimitive.
+Everything in here works on plain numpy arrays, no Blender data is touched.
+"""
+
+import numpy as np
+
+
+def chunk_bounds(tri_positions, tri_per_chunk: int):
+    """
+    Returns the min and max corner of the bounding box of every BoxColi chunk.
+    tri_positions holds the three corner positions of every triangle, in index buffer order
+    """
+    tri_positions = np.asarray(tri_positions, dtype=np.float64)
+    num_tris = len(tri_positions) // 3
+    chunk_starts = np.arange(0, num_tris, tri_per_chunk) * 3
+    chunk_min = np.minimum.reduceat(tri_positions, chunk_starts, axis=0)
+    chunk_max = np.maximum.reduceat(tri_positions, chunk_starts, axis=0)
+    return chunk_min, chunk_max
+
+
+def chunk_volume_report(tri_positions, tri_per_chunk: int):
+    """
+    Measures how tight the BoxColi chunks of a triangle order are.
+    Returns the summed volume of all chunk boxes and the summed volume of all pairwise overlaps
+    """
+    if len(tri_positions) == 0:
+        return 0.0, 0.0
+
+    chunk_min, chunk_max = chunk_bounds(tri_positions, tri_per_chunk)
+    total_volume = float(np.prod(chunk_max - chunk_min, axis=1).sum())
+
+    # compare the chunks in blocks of rows, only counting every pair once
+    num_chunks = len(chunk_min)
+    block_size = 128
+    overlap_volume = 0.0
+    for start in range(0, num_chunks, block_size):
+        block_min = chunk_min[start : start + block_size]
+        block_max = chunk_max[start : start + block_size]
+        lo = np.maximum(block_min[:, None, :], chunk_min[None, :, :])
+        hi = np.minimum(block_max[:, None, :], chunk_max[None, :, :])
+        intersection = np.prod(np.clip(hi - lo, 0, None), axis=2)
+        rows = np.arange(start, start + len(block_min))[:, None]
+        cols = np.arange(num_chunks)[None, :]
+        overlap_volume += float(intersection[cols > rows].sum())
+
+    return total_volume, overlap_volume
+
+
+def spatial_triangle_order(tri_positions, tri_per_chunk: int, method: str):
+    """
+    Returns a permutation of the triangles that groups spatially close triangles into the same BoxColi chunk.
+    method is either "MORTON" (sort along a Z-order curve) or "SAH" (chunk aligned surface area heuristic splits)
+    """
+    corners = np.asarray(tri_positions, dtype=np.float64).reshape(-1, 3, 3)
+    if method == "MORTON":
+        return morton_triangle_order(corners.mean(axis=1))
+    if method == "SAH":
+        return sah_triangle_order(corners, tri_per_chunk)
+    return np.arange(len(corners))
+
+
+def morton_triangle_order(centroids):
+    """Sort triangles by the 30 bit Morton code of their centroid"""
+    bb_min = centroids.min(axis=0)
+    bb_diff = centroids.max(axis=0) - bb_min
+    cells = np.divide(
+        (centroids - bb_min) * 1023,
+        bb_diff,
+        out=np.zeros_like(centroids),
+        where=bb_diff != 0,
+    ).astype(np.uint64)
+
+    codes = np.zeros(len(centroids), dtype=np.uint64)
+    for axis in range(3):
+        codes |= spread_bits(cells[:, axis]) << np.uint64(axis)
+
+    return np.argsort(codes, kind="stable")
+
+
+def spread_bits(values):
+    """Inserts two zero bits between each of the lower 10 bits of the given values"""
+    values = values & np.uint64(0x3FF)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x030000FF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x0300F00F)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x030C30C3)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x09249249)
+    return values
+
+
+def sah_triangle_order(corners, tri_per_chunk: int):
+    """
+    Top-down split of the triangles using the surface area heuristic.
+    Splits are only placed at multiples of tri_per_chunk so every leaf lines up with a BoxColi chunk.
+    """
+    tri_min = corners.min(axis=1)
+    tri_max = corners.max(axis=1)
+    centroids = corners.mean(axis=1)
+
+    order = []
+    stack = [np.arange(len(corners))]
+    while stack:
+        tris = stack.pop()
+        num_tris = len(tris)
+        if num_tris <= tri_per_chunk:
+            order.append(tris)
+            continue
+
+        splits = np.arange(tri_per_chunk, num_tris, tri_per_chunk)
+        best_cost = np.inf
+        best_tris = tris
+        best_split = splits[0]
+        for axis in range(3):
+            sorted_tris = tris[np.argsort(centroids[tris, axis], kind="stable")]
+            left_min = np.minimum.accumulate(tri_min[sorted_tris], axis=0)
+            left_max = np.maximum.accumulate(tri_max[sorted_tris], axis=0)
+            right_min = np.minimum.accumulate(tri_min[sorted_tris][::-1], axis=0)[::-1]
+            right_max = np.maximum.accumulate(tri_max[sorted_tris][::-1], axis=0)[::-1]
+
+            left_area = half_surface_area(left_min[splits - 1], left_max[splits - 1])
+            right_area = half_surface_area(right_min[splits], right_max[splits])
+            costs = left_area * splits + right_area * (num_tris - splits)
+
+            i = int(np.argmin(costs))
+            if costs[i] < best_cost:
+                best_cost = costs[i]
+                best_tris = sorted_tris
+                best_split = splits[i]
+
+        # push the right side first so the left side gets emitted first
+        stack.append(best_tris[best_split:])
+        stack.append(best_tris[:best_split])
+
+    return np.concatenate(order)
+
+
+def half_surface_area(bb_min, bb_max):
+    extent = bb_max - bb_min
+    return (
+        extent[:, 0] * extent[:, 1]
+        + extent[:, 1] * extent[:, 2]
+        + extent[:, 2] * extent[:, 0]
+    )
+
+
+def simulate_vertex_cache(indices, cache_size: int = 16):
+    """
+    Runs the index buffer through a FIFO post-transform vertex cache.
+    Returns a boolean array telling for every index if it caused a cache miss
+    """
+    inserted_at = {}
+    num_inserted = 0
+    misses = [False] * len(indices)
+    for i, v in enumerate(indices.tolist()):
+        if num_inserted - inserted_at.get(v, -cache_size - 1) > cache_size:
+            inserted_at[v] = num_inserted
+            num_inserted += 1
+            misses[i] = True
+    return np.array(misses, dtype=bool)
+
+
+def vertex_cache_report(indices, cache_size: int = 16):
+    """
+    Returns the average cache miss ratio (transformed vertices per triangle) and
+    the average transform to vertex ratio (transformed vertices per used vertex)
+    """
+    if len(indices) == 0:
+        return 0.0, 0.0
+    num_misses = int(simulate_vertex_cache(indices, cache_size).sum())
+    acmr = num_misses / (len(indices) // 3)
+    atvr = num_misses / len(np.unique(indices))
+    return acmr, atvr
+
+
+def tipsify(indices, num_vertices: int, cache_size: int = 16):
+    """
+    Vertex cache aware triangle ordering, as described in
+    "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw" by Sander, Nehab and Barczak.
+    Returns the new order of the triangles
+    """
+    triangles = indices.reshape(-1, 3)
+    num_tris = len(triangles)
+
+    # triangles adjacent to every vertex
+    corner_order = np.argsort(indices, kind="stable")
+    adjacency_offsets = np.searchsorted(
+        indices[corner_order], np.arange(num_vertices + 1)
+    ).tolist()
+    adjacency = (corner_order // 3).tolist()
+
+    live_triangles = np.bincount(indices, minlength=num_vertices).tolist()
+    cache_time = [0] * num_vertices
+    emitted = [False] * num_tris
+    triangles = triangles.tolist()
+
+    tri_order = []
+    dead_end = []
+    time_stamp = cache_size + 1
+    cursor = 0
+
+    fan_vertex = 0
+    while fan_vertex < num_vertices and live_triangles[fan_vertex] == 0:
+        fan_vertex += 1
+    if fan_vertex == num_vertices:
+        return np.arange(num_tris)
+
+    while fan_vertex >= 0:
+        candidates = []
+        for t in adjacency[adjacency_offsets[fan_vertex] : adjacency_offsets[fan_vertex + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            tri_order.append(t)
+            for v in triangles[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live_triangles[v] -= 1
+                if time_stamp - cache_time[v] > cache_size:
+                    cache_time[v] = time_stamp
+                    time_stamp += 1
+
+        # pick the candidate that will still be in the cache when all its triangles are emitted
+        fan_vertex = -1
+        best_priority = -1
+        for v in candidates:
+            if live_triangles[v] > 0:
+                priority = 0
+                if time_stamp - cache_time[v] + 2 * live_triangles[v] <= cache_size:
+                    priority = time_stamp - cache_time[v]
+                if priority > best_priority:
+                    best_priority = priority
+                    fan_vertex = v
+
+        if fan_vertex == -1:
+            while dead_end:
+                v = dead_end.pop()
+                if live_triangles[v] > 0:
+                    fan_vertex = v
+                    break
+
+        if fan_vertex == -1:
+            while cursor < num_vertices:
+                if live_triangles[cursor] > 0:
+                    fan_vertex = cursor
+                    break
+                cursor += 1
+
+    return np.array(tri_order, dtype=np.int64)
+
+
+def overdraw_cluster_order(indices, positions, cache_size: int = 16):
+    """
+    Splits a cache optimized index buffer into clusters at hard cache flushes and sorts these clusters
+    so the ones facing away from the center of the mesh get drawn first.
+    Returns the new order of the triangles
+    """
+    triangles = indices.reshape(-1, 3)
+    if len(triangles) == 0:
+        return np.arange(0)
+
+    misses = simulate_vertex_cache(indices, cache_size).reshape(-1, 3)
+    cluster_starts = np.flatnonzero(misses.all(axis=1))
+    if len(cluster_starts) == 0 or cluster_starts[0] != 0:
+        cluster_starts = np.r_[0, cluster_starts]
+
+    corners = positions[triangles, :3]
+    tri_normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    tri_centroids = corners.mean(axis=1)
+    mesh_centroid = tri_centroids.mean(axis=0)
+
+    # area weighted normal and centroid of every cluster
+    tri_areas = np.linalg.norm(tri_normals, axis=1)
+    cluster_normals = np.add.reduceat(tri_normals, cluster_starts, axis=0)
+    cluster_areas = np.add.reduceat(tri_areas, cluster_starts)
+    cluster_centroids = np.add.reduceat(
+        tri_centroids * tri_areas[:, None], cluster_starts, axis=0
+    )
+    cluster_centroids = np.divide(
+        cluster_centroids,
+        cluster_areas[:, None],
+        out=np.zeros_like(cluster_centroids),
+        where=cluster_areas[:, None] != 0,
+    )
+    priority = np.einsum(
+        "ij,ij->i", cluster_centroids - mesh_centroid, cluster_normals
+    )
+
+    cluster_ends = np.r_[cluster_starts[1:], len(triangles)]
+    tri_order = [
+        np.arange(cluster_starts[c], cluster_ends[c])
+        for c in np.argsort(-priority, kind="stable")
+    ]
+    return np.concatenate(tri_order)
+
+
+def vertex_fetch_order(indices, num_vertices: int):
+    """
+    Orders the vertices by their first use in the index buffer.
+    Returns the remapped index buffer and the new order of the vertices
+    """
+    used_vertices, first_use = np.unique(indices, return_index=True)
+    vertex_order = used_vertices[np.argsort(first_use, kind="stable")]
+    unused = np.setdiff1d(np.arange(num_vertices), used_vertices, assume_unique=True)
+    vertex_order = np.r_[vertex_order, unused].astype(np.int64)
+
+    remap = np.empty(num_vertices, dtype=np.int64)
+    remap[vertex_order] = np.arange(num_vertices)
+    return remap[indices], vertex_order
+
+
+def optimize_vertex_cache(indices, positions, tri_per_chunk=None, cache_size: int = 16):
+    """
+    Reorders triangles for the post-transform vertex cache and vertices for fetch locality.
+    When tri_per_chunk is given triangles are only reordered within their BoxColi chunk,
+    so the chunk bounds stay the same.
+    Returns the new index buffer and the new order of the vertices
+    """
+    num_vertices = len(positions)
+    triangles = indices.reshape(-1, 3)
+
+    if tri_per_chunk is None:
+        tri_order = tipsify(indices, num_vertices, cache_size)
+        indices = triangles[tri_order].reshape(-1)
+        tri_order = overdraw_cluster_order(indices, positions, cache_size)
+        indices = indices.reshape(-1, 3)[tri_order].reshape(-1)
+    else:
+        chunks = []
+        for start in range(0, len(triangles), tri_per_chunk):
+            chunk = triangles[start : start + tri_per_chunk].reshape(-1)
+            chunk_vertices, local_indices = np.unique(chunk, return_inverse=True)
+            tri_order = tipsify(local_indices.reshape(-1), len(chunk_vertices), cache_size)
+            chunks.append(chunk.reshape(-1, 3)[tri_order].reshape(-1))
+        if chunks:
+            indices = np.concatenate(chunks)
+
+    return vertex_fetch_order(indices, num_vertices)
+
+
+def scale_bias(values):
+    """
+    Returns the per axis scale and bias a PrimMesh derives from the bounding box of values,
+    a zero sized axis gets a scale of 0.5
+    """
+    bb_min = values.min(axis=0)
+    bb_max = values.max(axis=0)
+    scale = (bb_max - bb_min) * 0.5
+    scale[scale <= 0.0] = 0.5
+    bias = (bb_max + bb_min) * 0.5
+    return scale, bias
+
+
+def quantize_short(values, scale, bias):
+    """Quantizes values the way writeShortQuantizedVecScaledBiased does"""
+    values = np.rint((np.asarray(values, dtype=np.float64) - bias) * 0x7FFF / scale)
+    return np.clip(values, -0x7FFF, 0x7FFF).astype("<i2")
+
+
+def quantize_unit_byte(values):
+    """Quantizes values in the -1 to 1 range the way writeUByteQuantizedVec does"""
+    values = np.rint((np.asarray(values, dtype=np.float32) + 1) * 255 / 2)
+    return np.clip(values, 0, 0xFF).astype(np.uint8)
+
+
+def weld_keys(keys):
+    """
+    Merges the rows of keys that are byte for byte identical.
+    keys is an (N, K) array, every row holds the packed on-disk data of one triangle corner.
+    Returns the index of the first corner of every unique vertex, ordered by first use,
+    and the index of the vertex of every corner
+    """
+    keys = np.ascontiguousarray(keys)
+    row_type = np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))
+    _, first, inverse = np.unique(
+        keys.view(row_type).reshape(-1), return_index=True, return_inverse=True
+    )
+    vertex_order = np.argsort(first, kind="stable")
+    remap = np.empty(len(vertex_order), dtype=np.int64)
+    remap[vertex_order] = np.arange(len(vertex_order))
+    return first[vertex_order], remap[inverse.reshape(-1)]
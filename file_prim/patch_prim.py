@@ -0,0 +1,278 @@
+"""
+In-place patching of the PrimObject headers of a RenderPrimitive.
+
+Only fixed size header fields are touched, the index, vertex and collision buffers stay bit-identical.
+This module does not depend on Blender, so it can also be used from the command line:
+
+    python patch_prim.py --objects 0-3 --lodmask 0x01 path/to/*.prim
+    python patch_prim.py --rules rules.json
+    python patch_prim.py --show path/to/file.prim
+"""
+
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+
+# offset inside the PrimObject header, struct format
+MESH_FIELDS = {
+    "lodmask": (6, "<B"),
+    "zbias": (8, "<B"),
+    "zoffset": (9, "<B"),
+    "material_id": (10, "<H"),
+}
+
+SUB_MESH_FIELDS = {
+    "variant_id": (7, "<B"),
+    "color1": (16, "<4B"),
+}
+
+PRIM_TYPE_OBJECT_HEADER = 1
+PRIM_TYPE_MESH = 2
+PRIM_OBJECT_PROPERTIES_OFFSET = 5
+PRIM_OBJECT_USE_COLOR1 = 0b100000
+PRIM_MESH_SUB_MESH_TABLE_OFFSET = 44
+
+
+def read_uint(buf, offset):
+    if offset < 0 or offset + 4 > len(buf):
+        raise ValueError("offset 0x%X is outside of the file" % offset)
+    return struct.unpack_from("<I", buf, offset)[0]
+
+
+def read_prim_type(buf, offset):
+    if offset < 0 or offset + 4 > len(buf):
+        raise ValueError("offset 0x%X is outside of the file" % offset)
+    return struct.unpack_from("<H", buf, offset + 2)[0]
+
+
+def get_object_offsets(buf):
+    """
+    Resolves the header offsets of every object in a RenderPrimitive.
+    Returns a list of (mesh header offset, sub mesh header offset) pairs
+    """
+    header_offset = read_uint(buf, 0)
+    if read_prim_type(buf, header_offset) != PRIM_TYPE_OBJECT_HEADER:
+        raise ValueError("not a RenderPrimitive, the object header is missing")
+
+    num_objects = read_uint(buf, header_offset + 12)
+    object_table_offset = read_uint(buf, header_offset + 16)
+
+    offsets = []
+    for i in range(num_objects):
+        mesh_offset = read_uint(buf, object_table_offset + i * 4)
+        if read_prim_type(buf, mesh_offset) != PRIM_TYPE_MESH:
+            raise ValueError("object %d is not a mesh" % i)
+        sub_mesh_table_offset = read_uint(
+            buf, mesh_offset + PRIM_MESH_SUB_MESH_TABLE_OFFSET
+        )
+        sub_mesh_offset = read_uint(buf, sub_mesh_table_offset)
+        offsets.append((mesh_offset, sub_mesh_offset))
+    return offsets
+
+
+def get_field(name):
+    """Returns if the field lives in the sub mesh header, its offset and its struct format"""
+    if name in MESH_FIELDS:
+        return (False,) + MESH_FIELDS[name]
+    if name in SUB_MESH_FIELDS:
+        return (True,) + SUB_MESH_FIELDS[name]
+    raise ValueError("unknown PRIM field: " + name)
+
+
+def validate_changes(changes: dict):
+    for name, value in changes.items():
+        fmt = get_field(name)[2]
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if len(values) != len(struct.unpack(fmt, bytes(struct.calcsize(fmt)))):
+            raise ValueError("wrong number of values for " + name)
+        limit = 0xFFFF if fmt.endswith("H") else 0xFF
+        for v in values:
+            if not 0 <= v <= limit:
+                raise ValueError("%s value %d is out of range" % (name, v))
+
+
+def read_prim_fields(filepath):
+    """Returns the patchable fields of every object in the RenderPrimitive"""
+    with open(os.fsencode(filepath), "rb") as f:
+        buf = f.read()
+
+    objects = []
+    for mesh_offset, sub_mesh_offset in get_object_offsets(buf):
+        fields = {}
+        for name in list(MESH_FIELDS) + list(SUB_MESH_FIELDS):
+            in_sub_mesh, offset, fmt = get_field(name)
+            base = sub_mesh_offset if in_sub_mesh else mesh_offset
+            value = struct.unpack_from(fmt, buf, base + offset)
+            fields[name] = list(value) if len(value) > 1 else value[0]
+        objects.append(fields)
+    return objects
+
+
+def patch_prim(filepath, changes: dict, objects=None, dry_run: bool = False):
+    """
+    Patches the given header fields of a RenderPrimitive in place.
+    changes maps a field name (see MESH_FIELDS and SUB_MESH_FIELDS) to its new value,
+    objects is a list of object indices to patch, or None to patch all objects.
+    Returns the number of objects that were patched
+    """
+    validate_changes(changes)
+
+    with open(os.fsencode(filepath), "r+b") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as buf:
+            offsets = get_object_offsets(buf)
+            if objects is None:
+                objects = range(len(offsets))
+
+            # check every index before writing, a failed patch leaves the file untouched
+            for index in objects:
+                if not 0 <= index < len(offsets):
+                    raise ValueError(
+                        "object %d is out of range, the PRIM has %d objects"
+                        % (index, len(offsets))
+                    )
+
+            num_patched = 0
+            for index in objects:
+                mesh_offset, sub_mesh_offset = offsets[index]
+                for name, value in changes.items():
+                    in_sub_mesh, offset, fmt = get_field(name)
+                    base = sub_mesh_offset if in_sub_mesh else mesh_offset
+                    values = value if isinstance(value, (list, tuple)) else [value]
+
+                    if name == "color1":
+                        properties = buf[sub_mesh_offset + PRIM_OBJECT_PROPERTIES_OFFSET]
+                        if not properties & PRIM_OBJECT_USE_COLOR1:
+                            print(
+                                "%s: object %d does not use color1, the patched color has no effect"
+                                % (filepath, index)
+                            )
+
+                    if not dry_run:
+                        struct.pack_into(fmt, buf, base + offset, *values)
+                num_patched += 1
+
+            if not dry_run:
+                buf.flush()
+    return num_patched
+
+
+def parse_object_ranges(ranges: str):
+    """Turns a string like "0-3,5" into a list of object indices, raises a ValueError when it is malformed"""
+    objects = []
+    for part in ranges.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                first, last = int(first, 0), int(last, 0)
+            else:
+                first = last = int(part, 0)
+        except ValueError:
+            raise ValueError('invalid object range "%s"' % part) from None
+        if first < 0 or last < first:
+            raise ValueError('invalid object range "%s"' % part)
+        objects.extend(range(first, last + 1))
+    return objects
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        paths.extend(sorted(matches) if matches else [pattern])
+    return paths
+
+
+def run_rules(rules, dry_run: bool = False):
+    """
+    Applies a list of batch rules. Every rule is a dict with:
+        "files": list of paths or glob patterns
+        "objects": optional object ranges, like "0-3,5"
+        "set": dict of field names and their new values
+    Returns the number of files that failed to patch
+    """
+    num_failed = 0
+    for rule in rules:
+        objects = None
+        if rule.get("objects") is not None:
+            try:
+                objects = parse_object_ranges(str(rule["objects"]))
+            except ValueError as err:
+                print("rule for %s skipped, %s" % (rule.get("files", []), err))
+                num_failed += 1
+                continue
+        changes = rule.get("set", {})
+        for path in expand_paths(rule.get("files", [])):
+            try:
+                num_patched = patch_prim(path, changes, objects, dry_run)
+                print("%s: patched %d objects" % (path, num_patched))
+            except (OSError, ValueError, struct.error) as err:
+                print("%s: failed to patch, %s" % (path, err))
+                num_failed += 1
+    return num_failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Patch PrimObject header fields of RenderPrimitive (.prim) files in place"
+    )
+    parser.add_argument("files", nargs="*", help="PRIM files or glob patterns")
+    parser.add_argument("--objects", help='object indices to patch, like "0-3,5"')
+    parser.add_argument("--material-id", type=lambda v: int(v, 0))
+    parser.add_argument("--lodmask", type=lambda v: int(v, 0))
+    parser.add_argument("--z-bias", type=lambda v: int(v, 0))
+    parser.add_argument("--z-offset", type=lambda v: int(v, 0))
+    parser.add_argument("--variant-id", type=lambda v: int(v, 0))
+    parser.add_argument(
+        "--color1", type=lambda v: [int(c, 0) for c in v.split(",")], help="R,G,B,A"
+    )
+    parser.add_argument("--rules", help="JSON file with a list of batch rules")
+    parser.add_argument("--show", action="store_true", help="print the current fields")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.show:
+        for path in expand_paths(args.files):
+            for i, fields in enumerate(read_prim_fields(path)):
+                print("%s [%d]: %s" % (path, i, fields))
+        return 0
+
+    rules = []
+    if args.rules:
+        with open(args.rules, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+
+    changes = {
+        name: value
+        for name, value in (
+            ("material_id", args.material_id),
+            ("lodmask", args.lodmask),
+            ("zbias", args.z_bias),
+            ("zoffset", args.z_offset),
+            ("variant_id", args.variant_id),
+            ("color1", args.color1),
+        )
+        if value is not None
+    }
+    if changes and args.files:
+        if args.objects is not None:
+            try:
+                parse_object_ranges(args.objects)
+            except ValueError as err:
+                parser.error("--objects: %s" % err)
+        rules.append({"files": args.files, "objects": args.objects, "set": changes})
+
+    if not rules:
+        parser.error("nothing to patch")
+
+    return 1 if run_rules(rules, args.dry_run) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
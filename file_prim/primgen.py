@@ -0,0 +1,108 @@
+"""
+Encodes PRIM files in separate Python processes.
+PRIM encoding is pure Python, threads of one process would take turns on the GIL,
+so every exported collection is encoded by running this file as its own process:
+
+    python primgen.py job.pickle result.pickle
+
+This module does not import Blender. When it runs as that process it loads format.py and io_binary.py
+without running the __init__ of the addon, which imports bpy.
+"""
+
+import importlib
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import types
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_io_binary(package):
+    """
+    Registers the addon packages without running their __init__ and returns the io_binary module.
+    Unpickling a prim then imports the format module from the addon folder
+    """
+    for name, path in (
+        (package, ADDON_DIR),
+        (package + ".file_prim", os.path.join(ADDON_DIR, "file_prim")),
+    ):
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = [path]
+            sys.modules[name] = module
+    return importlib.import_module(package + ".io_binary")
+
+
+def encode_prim(prim, filepath, io_binary):
+    """Writes prim to filepath in this process, returns the section sizes of every object"""
+    bre = io_binary.BinaryReader(open(filepath, "wb"))
+    try:
+        prim.write(bre)
+    finally:
+        bre.close()
+    return [
+        prim_obj.sub_mesh.section_sizes
+        for prim_obj in prim.header.object_table
+        if prim_obj is not None
+    ]
+
+
+def write_prim_in_subprocess(prim, filepath):
+    """
+    Encodes prim to filepath in a separate Python process.
+    Falls back to encoding in this process when the process cannot be started,
+    raises a RuntimeError when the encoding itself failed
+    """
+    package = __name__.rsplit(".", 2)[0]
+    fd, job_path = tempfile.mkstemp(suffix=".pickle")
+    result_path = job_path + ".result"
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # the package comes first, the process needs it to load the classes of the pickled prim
+            pickle.dump(package, f)
+            pickle.dump(
+                (prim, os.fsencode(filepath)), f, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), job_path, result_path],
+                capture_output=True,
+                text=True,
+            )
+        except OSError as err:
+            print("Could not start the PRIM encoding process: " + str(err))
+            io_binary = load_io_binary(package)
+            section_sizes = encode_prim(prim, filepath, io_binary)
+        else:
+            if result.returncode != 0:
+                raise RuntimeError(
+                    "Encoding %s failed:\n%s" % (os.fsdecode(filepath), result.stderr)
+                )
+            with open(result_path, "rb") as f:
+                section_sizes = pickle.load(f)
+    finally:
+        os.remove(job_path)
+        if os.path.exists(result_path):
+            os.remove(result_path)
+
+    objects = [prim_obj for prim_obj in prim.header.object_table if prim_obj is not None]
+    for prim_obj, sizes in zip(objects, section_sizes):
+        prim_obj.sub_mesh.section_sizes = sizes
+
+
+def main(argv):
+    with open(argv[1], "rb") as f:
+        package = pickle.load(f)
+        io_binary = load_io_binary(package)
+        prim, filepath = pickle.load(f)
+    section_sizes = encode_prim(prim, filepath, io_binary)
+    with open(argv[2], "wb") as f:
+        pickle.dump(section_sizes, f)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,204 @@
+"""
+Evaluates the meshes of exported objects once per export.
+All objects go through a single depsgraph, the arrays the PRIM and ALOC writers need are
+extracted right away and the temporary mesh is released before the next object is evaluated.
+"""
+
+import time
+import bpy
+import bmesh
+import numpy as np
+
+from . import timing
+
+
+class EvaluatedMesh:
+    """
+    The world space arrays of an evaluated mesh object.
+    Loop attributes are only filled when the mesh was evaluated with attributes
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.locs = np.zeros((0, 4))
+        self.vertex_indices = np.zeros(0, dtype=np.uint32)
+        self.loop_triangles = np.zeros(0, dtype=np.uint32)
+        self.normals = None
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = []
+        self.colors = None
+
+    @property
+    def num_loops(self):
+        return len(self.vertex_indices)
+
+
+class MeshCache:
+    """
+    Evaluates every (object, key) pair once, key tells apart LODs of the same object.
+    The evaluation and extraction times are added to report, a timing.TimingReport, when given
+    """
+
+    def __init__(self, report=None):
+        self.depsgraph = bpy.context.evaluated_depsgraph_get()
+        self.report = report
+        self.meshes = {}
+
+    def update(self):
+        """Re-evaluates the depsgraph, call this after changing the modifiers of an object"""
+        self.depsgraph.update()
+
+    def get(self, obj, key=None, attributes: bool = True):
+        cache_key = (obj.name_full, key, attributes)
+        evaluated = self.meshes.get(cache_key)
+        if evaluated is None:
+            evaluated = evaluate_mesh(obj, self.depsgraph, attributes, self.report)
+            self.meshes[cache_key] = evaluated
+        return evaluated
+
+    def clear(self):
+        self.meshes.clear()
+
+
+def evaluate_mesh(obj, depsgraph, attributes: bool = True, report=None):
+    """
+    Extracts the arrays of the evaluated mesh of obj.
+    Only the positions, loop vertex indices and loop triangles are read when attributes is False
+    """
+    evaluation_start = time.perf_counter()
+    mesh_owner = obj.evaluated_get(depsgraph)
+    mesh = mesh_owner.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+    try:
+        evaluated = EvaluatedMesh(obj.data.name)
+        matrix = obj.matrix_world.copy()
+
+        if attributes:
+            # tangents can only be calculated for triangles and quads,
+            # the triangles themselves are taken from the loop triangles below
+            if has_ngons(mesh):
+                triangulate_mesh(mesh)
+            if mesh.uv_layers:
+                mesh.calc_tangents(uvmap=mesh.uv_layers.active.name)
+
+        extraction_start = time.perf_counter()
+        timing.add_time(report, "evaluation", extraction_start - evaluation_start)
+        evaluated.locs = get_positions(mesh, matrix)
+
+        vidxs = np.empty(len(mesh.loops), dtype=np.uint32)
+        mesh.loops.foreach_get("vertex_index", vidxs)
+        evaluated.vertex_indices = vidxs
+
+        if attributes:
+            evaluated.normals = get_normals(mesh, matrix)
+            if mesh.uv_layers:
+                evaluated.tangents = get_tangents(mesh)
+                evaluated.bitangents = get_bitangents(mesh)
+            evaluated.uvs = [get_uvs(mesh, uv_i) for uv_i in range(len(mesh.uv_layers))]
+            if len(mesh.vertex_colors) > 0:
+                evaluated.colors = get_colors(mesh, 0)
+
+        mesh.calc_loop_triangles()
+        loop_indices = np.empty(len(mesh.loop_triangles) * 3, dtype=np.uint32)
+        mesh.loop_triangles.foreach_get("loops", loop_indices)
+        evaluated.loop_triangles = loop_indices
+        timing.add_time(report, "extraction", time.perf_counter() - extraction_start)
+    finally:
+        mesh_owner.to_mesh_clear()
+
+    return evaluated
+
+
+def get_positions(mesh, matrix):
+    """Get the world space location of each vertex, the mesh is left untouched."""
+    locs = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", locs)
+    locs = locs.reshape(len(mesh.vertices), 3)
+
+    matrix = np.array(matrix, dtype=np.float32)
+    locs = locs @ matrix[:3, :3].T + matrix[:3, 3]
+    locs = np.c_[locs, np.ones(len(mesh.vertices), dtype=int)]
+
+    return locs
+
+
+def get_normals(mesh, matrix=None):
+    """Get normal for each loop, in world space when a world matrix is given."""
+    normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+
+    if bpy.app.version < (4, 1, 0):
+        mesh.calc_normals_split()
+
+    mesh.loops.foreach_get("normal", normals)
+
+    normals = normals.reshape(len(mesh.loops), 3)
+
+    if matrix is not None:
+        normal_matrix = np.array(
+            matrix.to_3x3().inverted_safe().transposed(), dtype=np.float32
+        )
+        normals = normals @ normal_matrix.T
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        np.divide(normals, lengths, out=normals, where=lengths != 0)
+
+    normals[~normals.any(axis=1), 2] = 1
+
+    return normals
+
+
+def get_tangents(mesh):
+    """Get an array of the tangent for each loop."""
+    tangents = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    mesh.loops.foreach_get("tangent", tangents)
+    tangents = tangents.reshape(len(mesh.loops), 3)
+    tangents = np.c_[tangents, np.ones(len(mesh.loops), dtype=int)]
+
+    return tangents
+
+
+def get_bitangents(mesh):
+    """Get an array of the tangent for each loop."""
+    bitangents = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    mesh.loops.foreach_get("bitangent", bitangents)
+    bitangents = bitangents.reshape(len(mesh.loops), 3)
+    bitangents = np.c_[bitangents, np.ones(len(mesh.loops), dtype=int)]
+
+    return bitangents
+
+
+def get_uvs(mesh, uv_i):
+    layer = mesh.uv_layers[uv_i]
+    uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+    layer.data.foreach_get("uv", uvs)
+    uvs = uvs.reshape(len(mesh.loops), 2)
+
+    # u,v -> u,1-v
+    uvs[:, 1] *= -1
+    uvs[:, 1] += 1
+
+    return uvs
+
+
+def get_colors(mesh, color_i):
+    colors = np.empty(len(mesh.loops) * 4, dtype=np.float32)
+    layer = mesh.vertex_colors[color_i]
+    mesh.color_attributes[layer.name].data.foreach_get("color", colors)
+    colors = colors.reshape(len(mesh.loops), 4)
+    return colors
+
+
+def has_ngons(mesh):
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return loop_totals.max(initial=0) > 4
+
+
+def triangulate_mesh(me):
+    """Triangulates a temporary mesh in place, never call this on the data of a scene object"""
+    bm = bmesh.new()
+    bm.from_mesh(me)
+
+    bmesh.ops.triangulate(bm, faces=bm.faces[:])
+
+    bm.to_mesh(me)
+    bm.free()
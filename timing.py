@@ -0,0 +1,167 @@
+"""
+Wall time and counter instrumentation for the importers and exporters.
+The report is passed explicitly, the stage and count functions do nothing when it is None,
+so instrumented code does not need to know whether a report is being collected.
+Code running on worker threads passes the item returned by begin, the current item may have moved on by then.
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TimingReport:
+    """Collects the wall time per stage and counters (vertices, triangles, bytes...) per item"""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.items = []
+        self.current = None
+        self.start = time.perf_counter()
+        self.total_time = 0
+        self.lock = threading.Lock()
+
+    def begin(self, name: str):
+        """
+        Starts a new item, like a file or a collection. Following stages and counts are added to it.
+        Returns the item
+        """
+        with self.lock:
+            self.current = {"name": name, "stages": {}, "counters": {}}
+            self.items.append(self.current)
+            return self.current
+
+    def get_item(self, item=None):
+        if item is not None:
+            return item
+        if self.current is None:
+            self.begin(self.title)
+        return self.current
+
+    def add_time(self, stage_name: str, seconds: float, item=None):
+        item = self.get_item(item)
+        with self.lock:
+            stages = item["stages"]
+            stages[stage_name] = stages.get(stage_name, 0) + seconds
+
+    def count(self, item=None, **counters):
+        item = self.get_item(item)
+        with self.lock:
+            item_counters = item["counters"]
+            for name, value in counters.items():
+                item_counters[name] = item_counters.get(name, 0) + value
+
+    def add_object(self, name: str, item=None, **values):
+        """Adds the values of one object, like a mesh of a collection, to the item"""
+        item = self.get_item(item)
+        with self.lock:
+            item.setdefault("objects", []).append(dict(name=name, **values))
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.start
+
+    def get_totals(self):
+        stages = {}
+        counters = {}
+        for item in self.items:
+            for name, value in item["stages"].items():
+                stages[name] = stages.get(name, 0) + value
+            for name, value in item["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+        return stages, counters
+
+    def summary(self):
+        """Returns the summary as a list of lines"""
+        stages, counters = self.get_totals()
+        lines = [
+            "%s: %d items in %.3fs" % (self.title, len(self.items), self.total_time)
+        ]
+        if counters:
+            lines.append(
+                ", ".join("%s %d" % (name, value) for name, value in counters.items())
+            )
+        for name, value in sorted(stages.items(), key=lambda stage: -stage[1]):
+            share = value / self.total_time * 100 if self.total_time > 0 else 0
+            lines.append("  %s: %.3fs (%.1f%%)" % (name, value, share))
+        return lines
+
+    def write(self, filepath: str):
+        """Writes every item to a .json or .csv file, picked by the extension"""
+        stages, counters = self.get_totals()
+        if os.path.splitext(filepath)[1].lower() == ".csv":
+            stage_names = list(stages)
+            counter_names = list(counters)
+            with open(filepath, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name"] + stage_names + counter_names)
+                for item in self.items:
+                    writer.writerow(
+                        [item["name"]]
+                        + [round(item["stages"].get(name, 0), 6) for name in stage_names]
+                        + [item["counters"].get(name, 0) for name in counter_names]
+                    )
+        else:
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "title": self.title,
+                        "total_time": self.total_time,
+                        "stages": stages,
+                        "counters": counters,
+                        "items": self.items,
+                    },
+                    f,
+                    indent=4,
+                )
+
+
+def begin(report, name: str):
+    """Starts a new item on the report, returns it or None when there is no report"""
+    if report is not None:
+        return report.begin(name)
+    return None
+
+
+@contextmanager
+def stage(report, name: str, item=None):
+    """Adds the wall time of the block to the given stage of the report"""
+    if report is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report.add_time(name, time.perf_counter() - start, item)
+
+
+def add_time(report, name: str, seconds: float, item=None):
+    if report is not None:
+        report.add_time(name, seconds, item)
+
+
+def count(report, item=None, **counters):
+    if report is not None:
+        report.count(item, **counters)
+
+
+def add_object(report, name: str, item=None, **values):
+    if report is not None:
+        report.add_object(name, item, **values)
+
+
+def output(operator, report, filepath: str = ""):
+    """Prints the summary, shows it in the Info editor and optionally writes it to filepath"""
+    import bpy
+
+    if report is None:
+        return
+    report.finish()
+    for line in report.summary():
+        print(line)
+        operator.report({"INFO"}, line)
+    if filepath:
+        report.write(bpy.path.abspath(filepath))